@@ -37,4 +37,13 @@ def create_app(config_object="config.Config"):
     app.register_blueprint(student_bp, url_prefix="/student")
     register_filters(app)
 
+    from .services import sharding, term_archive, seat_feed, profiler
+    sharding.init_app(app)
+    term_archive.init_app(app)
+    seat_feed.init_app(app)
+    profiler.init_app(app)
+
+    from .cli import register_commands
+    register_commands(app)
+
     return app
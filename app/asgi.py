@@ -0,0 +1,288 @@
+"""ASGI entry point for read-heavy student traffic.
+
+``/student/api/{sections,seats,timetable,grades}`` run on an aiosqlite engine
+with a bounded connection pool, so waiting on the database no longer pins a
+worker.  Every other path (pages, writes, auth) goes to the regular Flask
+app through asgiref's WSGI adapter.  Both sides share the models, the query
+builders in ``services.student_data`` and the Flask session cookie.
+
+``/student/api/seats/stream?term=`` is a server-sent-events channel fed by
+``services.seat_feed``: one snapshot on connect, then coalesced deltas.
+
+Term-scoped reads are routed like ``term_archive.session_for_term``: to the
+term's archive file or shard.  With ``SHARDS`` configured, requests without
+a term would have to scatter, so they are served by the Flask side instead.
+"""
+import asyncio
+import json
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from . import create_app
+from .models import Enrollment, Section, TermArchive, TermShard, User
+from .services import seat_feed, student_data
+
+
+def async_uri(uri):
+    if uri.startswith("sqlite:///"):
+        return "sqlite+aiosqlite:///" + uri[len("sqlite:///"):]
+    return uri
+
+
+class StudentAPI:
+    def __init__(self, flask_app):
+        cfg = flask_app.config
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.pool = {"pool_size": cfg["ASYNC_POOL_SIZE"], "max_overflow": 0,
+                     "pool_timeout": cfg["ASYNC_POOL_TIMEOUT"]}
+        uri = cfg.get("ASYNC_DATABASE_URI") or async_uri(cfg["SQLALCHEMY_DATABASE_URI"])
+        self.engine = create_async_engine(uri, **self.pool)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.archives = {}
+        self.shard_uris = cfg["SHARDS"]
+        self.shards = {}
+        self.directory = make_url(cfg["SQLALCHEMY_DATABASE_URI"]).database
+        self.serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.cookie_name = cfg["SESSION_COOKIE_NAME"]
+        self.max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        self.routes = {
+            "/student/api/sections": self.sections,
+            "/student/api/seats": self.seats,
+            "/student/api/timetable": self.timetable,
+            "/student/api/grades": self.grades,
+        }
+        self.streams = {"/student/api/seats/stream": self.seat_stream}
+        self.scatter_paths = {"/student/api/sections", "/student/api/timetable",
+                              "/student/api/grades"}
+        self.resync = cfg["SEAT_FEED_RESYNC_SECONDS"]
+        self.pollers = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        handler = stream = None
+        if scope["type"] == "http" and scope["method"] == "GET":
+            handler = self.routes.get(scope["path"])
+            stream = self.streams.get(scope["path"])
+        args = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+        if (self.shard_uris and scope["path"] in self.scatter_paths
+                and not (args.get("term") or "").strip()):
+            handler = None
+        if handler is None and stream is None:
+            return await self.wsgi(scope, receive, send)
+
+        uid = self.user_id(scope)
+        if uid is None:
+            return await self.respond(send, 401, {"error": "login required"})
+        try:
+            async with self.sessions() as hot:
+                user = (await hot.execute(select(User.role, User.student_id)
+                                          .where(User.id == uid))).one_or_none()
+                if user is None or user.role != "student":
+                    return await self.respond(send, 403, {"error": "forbidden"})
+                if stream is None:
+                    body = await handler(hot, user.student_id, args)
+        except PoolTimeout:
+            return await self.respond(send, 503, {"error": "busy"})
+        if stream is not None:
+            return await stream(args, receive, send)
+        await self.respond(send, 200, body)
+
+    async def lifespan(self, receive, send):
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                for task in self.pollers.values():
+                    task.cancel()
+                await self.engine.dispose()
+                for eng in [*self.archives.values(), *self.shards.values()]:
+                    await eng.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def user_id(self, scope):
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                morsel = SimpleCookie(value.decode("latin-1")).get(self.cookie_name)
+                if morsel is None:
+                    continue
+                try:
+                    data = self.serializer.loads(morsel.value, max_age=self.max_age)
+                except BadSignature:
+                    return None
+                uid = data.get("_user_id")
+                return int(uid) if uid is not None else None
+        return None
+
+    async def respond(self, send, status, body):
+        raw = json.dumps(body, separators=(",", ":")).encode()
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(raw)).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": raw})
+
+    async def term_session(self, hot, term):
+        """Same routing as ``term_archive.session_for_term``, async flavour."""
+        if not term:
+            return None
+        path = (await hot.execute(select(TermArchive.path)
+                                  .where(TermArchive.term == term))).scalar()
+        if path is not None:
+            eng = self.archives.get(path)
+            if eng is None:
+                eng = self.archives[path] = create_async_engine(
+                    f"sqlite+aiosqlite:///file:{path}?mode=ro&uri=true", **self.pool)
+            return async_sessionmaker(eng)()
+        if not self.shard_uris:
+            return None
+        shard = (await hot.execute(select(TermShard.shard)
+                                   .where(TermShard.term == term))).scalar()
+        if shard is None:
+            return None
+        return async_sessionmaker(self.shard_engine(shard))()
+
+    def shard_engine(self, name):
+        eng = self.shards.get(name)
+        if eng is None:
+            eng = self.shards[name] = create_async_engine(
+                async_uri(self.shard_uris[name]), **self.pool)
+            directory = self.directory
+
+            @event.listens_for(eng.sync_engine, "connect")
+            def _attach(dbapi_conn, _):
+                cur = dbapi_conn.cursor()
+                cur.execute("ATTACH DATABASE ? AS directory", (directory,))
+                cur.close()
+        return eng
+
+    async def run(self, hot, term, fn):
+        arc = await self.term_session(hot, term)
+        if arc is None:
+            return await fn(hot)
+        async with arc:
+            return await fn(arc)
+
+    async def sections(self, hot, student_id, args):
+        a = student_data.catalog_args(args)
+        count_q, page_q = student_data.catalog_stmts(a)
+
+        async def fn(s):
+            total = (await s.execute(count_q)).scalar()
+            rows = (await s.execute(page_q)).all()
+            ids = [r.id for r in rows]
+            slots = (await s.execute(student_data.slots_stmt(ids))).all()
+            mine = (await s.execute(student_data.my_sections_stmt(student_id, ids))).all()
+            return student_data.shape_catalog(a, total, rows, slots, mine)
+        return await self.run(hot, a["term"], fn)
+
+    async def seats(self, hot, student_id, args):
+        term = (args.get("term") or "").strip()
+
+        async def fn(s):
+            rows = (await s.execute(student_data.seats_stmt(term))).all()
+            return student_data.shape_seats(term, rows)
+        return await self.run(hot, term, fn)
+
+    async def timetable(self, hot, student_id, args):
+        term = (args.get("term") or "").strip()
+        if not term:
+            term = (await hot.execute(
+                select(func.max(Section.term)).join(Enrollment)
+                .where(Enrollment.student_id == student_id))).scalar() or ""
+
+        async def fn(s):
+            rows = (await s.execute(student_data.timetable_stmt(student_id, term))).all()
+            return student_data.shape_timetable(term, rows)
+        return await self.run(hot, term, fn)
+
+    async def grades(self, hot, student_id, args):
+        term = (args.get("term") or "").strip()
+
+        async def fn(s):
+            rows = (await s.execute(student_data.grades_stmt(student_id, term))).all()
+            return student_data.shape_grades(term, rows)
+        return await self.run(hot, term, fn)
+
+    async def seat_rows(self, term):
+        async def fn(s):
+            return (await s.execute(student_data.seats_stmt(term))).all()
+        async with self.sessions() as hot:
+            return await self.run(hot, term, fn)
+
+    async def poll_seats(self, term):
+        """Per-term resync so writes made by other workers reach our subscribers."""
+        try:
+            while seat_feed.feed.subscribers(term):
+                await asyncio.sleep(self.resync)
+                try:
+                    for r in await self.seat_rows(term):
+                        seat_feed.feed.publish(term, r.id, r.enrolled, r.capacity)
+                except PoolTimeout:
+                    pass
+        finally:
+            self.pollers.pop(term, None)
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        # a GET still delivers its (empty) http.request body first
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    async def seat_stream(self, args, receive, send):
+        term = (args.get("term") or "").strip()
+        if not term:
+            return await self.respond(send, 400, {"error": "term required"})
+        sub = seat_feed.feed.subscribe(term)
+        if term not in self.pollers:
+            self.pollers[term] = asyncio.create_task(self.poll_seats(term))
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            payload = None                      # None = send a full snapshot
+            while True:
+                if payload is None:
+                    rows = await self.seat_rows(term)
+                    seat_feed.feed.remember(term, rows)
+                    kind = "snapshot"
+                    payload = json.dumps(student_data.shape_seats(term, rows), separators=(",", ":"))
+                else:
+                    kind = "seats"
+                await send({"type": "http.response.body", "more_body": True,
+                            "body": f"event: {kind}\ndata: {payload}\n\n".encode()})
+                while True:
+                    getter = asyncio.ensure_future(sub.queue.get())
+                    done, _ = await asyncio.wait({getter, disconnected}, timeout=15,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if disconnected in done:
+                        getter.cancel()
+                        return
+                    if getter in done:
+                        payload = getter.result()
+                        break
+                    getter.cancel()
+                    await send({"type": "http.response.body", "body": b": ping\n\n",
+                                "more_body": True})
+        except (OSError, PoolTimeout):
+            pass
+        finally:
+            disconnected.cancel()
+            seat_feed.feed.unsubscribe(sub)
+
+
+def create_asgi_app(config_object="config.Config"):
+    return StudentAPI(create_app(config_object))
@@ -1,8 +1,8 @@
-from flask import render_template, request, redirect, url_for, flash
+from flask import render_template, request, redirect, url_for, flash, abort, jsonify, Response, current_app
 from sqlalchemy.orm import selectinload
 from ...extensions import db
 from app.blueprints.auth.routes import role_required
-from flask_login import login_required
+from flask_login import login_required, current_user
 from ...models import Course, Section, Student, Teacher, Timeslot
 from ...models.user import User
 from werkzeug.security import generate_password_hash
@@ -11,6 +11,11 @@ from sqlalchemy import func
 from sqlalchemy import or_
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
+import csv
+import io
+import json
+from ...models import TermArchive
+from ...services import term_archive, seat_feed, sharding, planner, bulk_enroll, profiler
 
 @bp.get("/courses")
 @login_required
@@ -50,14 +55,17 @@ def sections():
     page = max(request.args.get("page", type=int) or 1, 1)
     per  = min(max(request.args.get("per_page", type=int) or 10, 1), 100)
 
-    q = Section.query.join(Course).join(Teacher)
-    if term:
-        q = q.filter(Section.term == term)
-    if kw:
-        like = f"%{kw}%"
-        q = q.filter(or_(
-            Course.name.ilike(like), Course.code.ilike(like), Teacher.name.ilike(like)
-        ))
+    def build(sess):
+        q = sess.query(Section).join(Course).join(Teacher)
+        if term:
+            q = q.filter(Section.term == term)
+        if kw:
+            like = f"%{kw}%"
+            q = q.filter(or_(
+                Course.name.ilike(like), Course.code.ilike(like), Teacher.name.ilike(like)
+            ))
+        col = sort_map.get(sort, Section.term)
+        return q.order_by(col.desc() if order == "desc" else col.asc())
 
     sort_map = {
         "term": Section.term,
@@ -65,11 +73,15 @@ def sections():
         "teacher": Teacher.name,
         "cap": Section.capacity,
     }
-    col = sort_map.get(sort, Section.term)
-    q = q.order_by(col.desc() if order == "desc" else col.asc())
-
-    total = q.count()
-    items = q.offset((page - 1) * per).limit(per).all()
+    sort_key = {
+        "term": lambda s: s.term,
+        "course": lambda s: s.course.name,
+        "teacher": lambda s: s.teacher.name,
+        "cap": lambda s: s.capacity,
+    }.get(sort, lambda s: s.term)
+    sessions = [sharding.session_for(term)] if term else None
+    total, items = sharding.scatter_page(build, sort_key, reverse=order == "desc",
+                                         offset=(page - 1) * per, limit=per, sessions=sessions)
     pages = (total + per - 1) // per
 
     courses = Course.query.order_by(Course.code).all()
@@ -95,28 +107,38 @@ def create_section():
         flash("Capacity must be a positive integer"); return redirect(url_for("admin.sections"))
     if not db.session.get(Course, course_id) or not db.session.get(Teacher, teacher_id):
         flash("The course or teacher does not exist"); return redirect(url_for("admin.sections"))
-    db.session.add(Section(course_id=course_id, teacher_id=teacher_id, term=term, capacity=capacity))
-    db.session.commit(); flash("Classes have been created")
+    s = Section(course_id=course_id, teacher_id=teacher_id, term=term, capacity=capacity)
+    sess = sharding.session_for(term)
+    sess.add(s)
+    sess.commit(); flash("Classes have been created")
+    planner.invalidate(term)
+    seat_feed.publish_sections([s.id], session=sess)
     return redirect(url_for("admin.sections"))
 
 @bp.post("/sections/<int:sid>/delete")
 @login_required
 @role_required("admin")
 def delete_section(sid):
-    s = db.session.get(Section, sid)
+    sess, s = sharding.locate(Section, sid)
     if not s: flash("Class does not exist"); return redirect(url_for("admin.sections"))
-    db.session.delete(s); db.session.commit(); flash("Deleted class")
+    term = s.term
+    sess.delete(s); sess.commit(); flash("Deleted class")
+    planner.invalidate(term)
+    seat_feed.publish_removed(term, sid)
     return redirect(url_for("admin.sections"))
 
 @bp.get("/sections/<int:sid>/timeslots", endpoint="timeslots")
 @login_required
 @role_required("admin")
 def timeslots_page(sid):
-    sec = (Section.query
+    sess, sec = sharding.locate(Section, sid)
+    if sec is None:
+        abort(404)
+    sec = (sess.query(Section)
            .options(selectinload(Section.timeslots),
                     selectinload(Section.course),
                     selectinload(Section.teacher))
-           .get_or_404(sid))
+           .populate_existing().get(sid))
     return render_template("timeslots.html", sec=sec)
 
 @bp.post("/sections/<int:sid>/timeslots", endpoint="create_timeslot")
@@ -142,9 +164,14 @@ def create_timeslot(sid):
         flash("End time must be later than start time")
         return redirect(url_for("admin.timeslots", sid=sid))
 
-    db.session.add(Timeslot(section_id=sid, weekday=weekday,
-                            start_time=t_start, end_time=t_end, room=room))
-    db.session.commit()
+    sess, sec = sharding.locate(Section, sid)
+    if sec is None:
+        flash("Class does not exist")
+        return redirect(url_for("admin.sections"))
+    sess.add(Timeslot(section_id=sid, weekday=weekday,
+                      start_time=t_start, end_time=t_end, room=room))
+    sess.commit()
+    planner.invalidate(sec.term)
     flash("Class time added")
     return redirect(url_for("admin.timeslots", sid=sid))
 
@@ -152,16 +179,118 @@ def create_timeslot(sid):
 @login_required
 @role_required("admin")
 def delete_timeslot(tid):
-    ts = db.session.get(Timeslot, tid)
+    sess, ts = sharding.locate(Timeslot, tid)
     if not ts:
         flash("Timeslot does not exist")
         return redirect(url_for("admin.sections"))
     sid = ts.section_id
-    db.session.delete(ts)
-    db.session.commit()
+    term = ts.section.term
+    sess.delete(ts)
+    sess.commit()
+    planner.invalidate(term)
     flash("Timeslot deleted")
     return redirect(url_for("admin.timeslots", sid=sid))
 
+# ---------- Terms ----------
+@bp.get("/terms")
+@login_required
+@role_required("admin")
+def terms():
+    hot = sorted(sharding.term_loads(), reverse=True)
+    archived = TermArchive.query.order_by(TermArchive.term.desc()).all()
+    return render_template("terms.html", hot=hot, archived=archived, sharded=sharding.enabled())
+
+@bp.post("/terms/<term>/archive")
+@login_required
+@role_required("admin")
+def archive_term(term):
+    try:
+        counts = term_archive.archive_term(term)
+        flash(f"Archived {term}: {counts['section']} sections, {counts['enrollment']} enrollments")
+    except ValueError as e:
+        flash(str(e))
+    return redirect(url_for("admin.terms"))
+
+@bp.post("/terms/<term>/restore")
+@login_required
+@role_required("admin")
+def restore_term(term):
+    try:
+        term_archive.restore_term(term)
+        flash(f"Restored {term}")
+    except ValueError as e:
+        flash(str(e))
+    return redirect(url_for("admin.terms"))
+
+# ---------- Bulk enrollment ----------
+@bp.post("/enrollments/bulk")
+@login_required
+@role_required("admin")
+def bulk_enrollments():
+    """JSON ``{"pairs": [[student_no, section_id], ...], "dry_run"}``, or a CSV upload."""
+    upload = request.files.get("file")
+    if upload:
+        try:
+            pairs = bulk_enroll.parse_csv(upload.read().decode("utf-8-sig").splitlines())
+        except (UnicodeDecodeError, ValueError) as e:
+            flash(f"Invalid file: {e}")
+            return redirect(url_for("admin.sections"))
+        results, _ = bulk_enroll.enroll(pairs, dry_run=bool(request.form.get("dry_run")))
+        out = io.StringIO()
+        w = csv.DictWriter(out, bulk_enroll.REPORT_HEADER)
+        w.writeheader(); w.writerows(results)
+        return Response(out.getvalue(), mimetype="text/csv", headers={
+            "Content-Disposition": "attachment; filename=enrollment-report.csv"})
+
+    body = request.get_json(silent=True) or {}
+    try:
+        pairs = [(p["student_no"], p["section_id"]) if isinstance(p, dict) else tuple(p)
+                 for p in body.get("pairs") or []]
+        results, summary = bulk_enroll.enroll(pairs, dry_run=bool(body.get("dry_run")))
+    except (TypeError, ValueError, KeyError):
+        return jsonify({"error": "pairs must be [student_no, section_id] items"}), 400
+    return jsonify({"summary": summary, "results": results})
+
+# ---------- Profiles ----------
+@bp.get("/profiles")
+@login_required
+@role_required("admin")
+def profiles():
+    until = profiler.enabled_until()
+    return render_template("profiles.html", items=profiler.summaries(),
+                           until=datetime.fromtimestamp(until) if until > datetime.now().timestamp() else None,
+                           header=current_app.config["PROFILE_HEADER"],
+                           token=profiler.make_token(current_user.username))
+
+@bp.post("/profiles/toggle")
+@login_required
+@role_required("admin")
+def profile_toggle():
+    minutes = request.form.get("minutes", type=int) or 0
+    profiler.set_enabled(max(minutes, 0))
+    flash(f"Profiling every request for {minutes} minutes" if minutes > 0 else "Profiling switched off")
+    return redirect(url_for("admin.profiles"))
+
+@bp.get("/profiles/<profile_id>.<kind>")
+@login_required
+@role_required("admin")
+def profile_download(profile_id, kind):
+    try:
+        doc = profiler.load(profile_id)
+    except (OSError, ValueError):
+        abort(404)
+    if kind == "json":
+        body, mimetype = json.dumps(doc, indent=1), "application/json"
+    elif kind in ("wall", "cpu"):
+        body, mimetype = profiler.folded(doc, kind), "text/plain"
+    elif kind == "sql":
+        body, mimetype = profiler.sql_text(doc), "text/plain"
+    else:
+        abort(404)
+    ext = {"wall": "wall.folded", "cpu": "cpu.folded"}.get(kind, kind)
+    return Response(body, mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={profile_id}.{ext}"})
+
 # ---------- Students ----------
 @bp.get("/students")
 @login_required
@@ -1,4 +1,4 @@
-from flask import render_template, request, redirect, url_for, flash
+from flask import render_template, request, redirect, url_for, flash, jsonify
 from ...extensions import db
 from flask_login import login_required, current_user
 from app.blueprints.auth.routes import role_required
@@ -7,11 +7,24 @@ from . import bp
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
 from sqlalchemy import or_
+from sqlalchemy.orm import object_session
+from ...services import term_archive, student_data, seat_feed, sharding, transcript, planner
 from werkzeug.security import check_password_hash, generate_password_hash
+import heapq
+from itertools import islice
 
 def get_current_student():
     return current_user.student
 
+def my_terms(stu):
+    """Hot terms the student is enrolled in (newest first), then archived ones."""
+    hot = sharding.scatter(lambda s: s.query(Section.term).join(Enrollment)
+                           .filter(Enrollment.student_id == stu.id).distinct())
+    archived = [t for t in term_archive.archived_terms()
+                if term_archive.session_for_term(t).query(Enrollment.id)
+                .filter(Enrollment.student_id == stu.id).first()]
+    return sorted({t for (t,) in hot}, reverse=True) + archived or [""]
+
 def timeslot_overlap(a, b):
     if a.weekday != b.weekday:
         return False
@@ -28,28 +41,37 @@ def list_sections():
     page = max(request.args.get("page", type=int) or 1, 1)
     per  = min(max(request.args.get("per_page", type=int) or 10, 1), 100)
 
-    q = Section.query.join(Course).join(Teacher).options(
-        selectinload(Section.course), selectinload(Section.teacher), selectinload(Section.timeslots)
-    )
-    if term: q = q.filter(Section.term == term)
-    if kw:
-        like = f"%{kw}%"
-        q = q.filter(or_(Course.name.ilike(like), Course.code.ilike(like), Teacher.name.ilike(like)))
+    def build(sess):
+        q = sess.query(Section).join(Course).join(Teacher).options(
+            selectinload(Section.course), selectinload(Section.teacher), selectinload(Section.timeslots)
+        )
+        if term: q = q.filter(Section.term == term)
+        if kw:
+            like = f"%{kw}%"
+            q = q.filter(or_(Course.name.ilike(like), Course.code.ilike(like), Teacher.name.ilike(like)))
+        col = sort_map.get(sort, Course.name)
+        return q.order_by(col.desc() if order == "desc" else col.asc())
 
     sort_map = {"course": Course.name, "teacher": Teacher.name, "cap": Section.capacity}
-    col = sort_map.get(sort, Course.name)
-    q = q.order_by(col.desc() if order == "desc" else col.asc())
-
-    total = q.count()
-    sections = q.offset((page-1)*per).limit(per).all()
+    sort_key = {"course": lambda s: s.course.name, "teacher": lambda s: s.teacher.name,
+                "cap": lambda s: s.capacity}.get(sort, lambda s: s.course.name)
+    sessions = [term_archive.session_for_term(term)] if term else None
+    total, sections = sharding.scatter_page(build, sort_key, reverse=order == "desc",
+                                            offset=(page-1)*per, limit=per, sessions=sessions)
     pages = (total + per - 1)//per
 
-    counts = {s.id: Enrollment.query.filter_by(section_id=s.id).count() for s in sections}
+    counts = {s.id: object_session(s).query(Enrollment).filter_by(section_id=s.id).count()
+              for s in sections}
     stu = get_current_student()
-    my_enroll = {e.section_id: e.id for e in Enrollment.query.filter_by(student_id=stu.id).all()}
+    my_enroll = {sid: eid for sid, eid in sharding.scatter(
+        lambda s: s.query(Enrollment.section_id, Enrollment.id).filter_by(student_id=stu.id))}
+    if sessions and term_archive.is_archive(sessions[0]):
+        my_enroll.update(sessions[0].query(Enrollment.section_id, Enrollment.id)
+                         .filter_by(student_id=stu.id).all())
 
     return render_template("sections_student.html", sections=sections, counts=counts, term=term,
-                           my_enroll=my_enroll, q=kw, sort=sort, order=order,
+                           my_enroll=my_enroll, archived=bool(sessions) and term_archive.is_archive(sessions[0]),
+                           q=kw, sort=sort, order=order,
                            page=page, per_page=per, total=total, pages=pages)
 
 @bp.post("/sections/<int:section_id>/enroll")
@@ -57,15 +79,15 @@ def list_sections():
 @role_required("student")
 def enroll(section_id):
     stu = get_current_student()
-    sec = db.session.get(Section, section_id)
+    sess, sec = sharding.locate(Section, section_id)
     if not sec:
         flash("Class does not exist"); return redirect(url_for("student.list_sections"))
 
-    cur = Enrollment.query.filter_by(section_id=section_id).count()
+    cur = sess.query(Enrollment).filter_by(section_id=section_id).count()
     if cur >= sec.capacity:
         flash("Full"); return redirect(url_for("student.list_sections", term=sec.term))
 
-    my_enrolls = Enrollment.query.options(
+    my_enrolls = sess.query(Enrollment).options(
         selectinload(Enrollment.section).selectinload(Section.timeslots),
         selectinload(Enrollment.section).selectinload(Section.course),
     ).join(Section).filter(
@@ -82,12 +104,13 @@ def enroll(section_id):
                     return redirect(url_for("student.list_sections", term=sec.term))
 
     e = Enrollment(student_id=stu.id, section_id=section_id, status="enrolled")
-    db.session.add(e)
+    sess.add(e)
     try:
-        db.session.commit()
+        sess.commit()
+        seat_feed.publish_sections([section_id], session=sess)
         flash("Enroll was successful")
     except IntegrityError:
-        db.session.rollback()
+        sess.rollback()
         flash("Already enrolled")
     return redirect(url_for("student.list_sections", term=sec.term))
 
@@ -96,13 +119,16 @@ def enroll(section_id):
 @role_required("student")
 def drop(enroll_id):
     stu = get_current_student()
-    e = db.session.get(Enrollment, enroll_id)
+    sess, e = sharding.locate(Enrollment, enroll_id)
     if not e or e.student_id != stu.id:
         flash("No permission or record does not exist")
         return redirect(url_for("student.list_sections"))
     term = e.section.term
-    db.session.delete(e)
-    db.session.commit()
+    sid = e.section_id
+    sess.delete(e)
+    sess.commit()
+    transcript.invalidate([stu.id])
+    seat_feed.publish_sections([sid], session=sess)
     flash("Dropped")
     return redirect(url_for("student.list_sections", term=term))
 
@@ -111,10 +137,13 @@ def drop(enroll_id):
 @role_required("student")
 def my_timetable():
     stu = get_current_student()
-    enrolls = Enrollment.query.options(
+    terms = my_terms(stu)
+    term = (request.args.get("term") or "").strip() or terms[0]
+    sess = term_archive.session_for_term(term)
+    enrolls = sess.query(Enrollment).options(
         selectinload(Enrollment.section).selectinload(Section.course),
         selectinload(Enrollment.section).selectinload(Section.timeslots)
-    ).filter_by(student_id=stu.id).all()
+    ).join(Section).filter(Enrollment.student_id == stu.id, Section.term == term).all()
     table = {i: [] for i in range(1, 8)}
     for en in enrolls:
         sec = en.section
@@ -129,18 +158,25 @@ def my_timetable():
             })
     for w in table:
         table[w].sort(key=lambda x: x["start"])
-    return render_template("timetable.html", table=table)
+    return render_template("timetable.html", table=table, term=term, terms=terms)
 
 @bp.get("/me/grades")
 @login_required
 @role_required("student")
 def my_grades():
     stu = get_current_student()
-    enrolls = Enrollment.query.options(
-        selectinload(Enrollment.section).selectinload(Section.course),
-        selectinload(Enrollment.section).selectinload(Section.assessments),
-        selectinload(Enrollment.grades).selectinload(Grade.assessment)
-    ).filter_by(student_id=stu.id).all()
+    term = (request.args.get("term") or "").strip()
+
+    def load(sess):
+        q = sess.query(Enrollment).options(
+            selectinload(Enrollment.section).selectinload(Section.course),
+            selectinload(Enrollment.section).selectinload(Section.assessments),
+            selectinload(Enrollment.grades).selectinload(Grade.assessment)
+        ).filter(Enrollment.student_id == stu.id)
+        if term:
+            q = q.join(Section).filter(Section.term == term)
+        return q.all()
+    enrolls = load(term_archive.session_for_term(term)) if term else sharding.scatter(load)
 
     courses = []
     for en in enrolls:
@@ -162,7 +198,162 @@ def my_grades():
             "rows": rows,
             "total_percent": round(total * 100, 2)
         })
-    return render_template("grades.html", courses=courses)
+    return render_template("grades.html", courses=courses, term=term, terms=my_terms(stu))
+
+@bp.get("/me/transcript")
+@login_required
+@role_required("student")
+def my_transcript():
+    return render_template("transcript.html", t=transcript.cached_transcript(get_current_student()))
+
+# ---------- JSON read API (also served async by app.asgi) ----------
+@bp.get("/api/sections")
+@login_required
+@role_required("student")
+def api_sections():
+    a = student_data.catalog_args(request.args)
+    sessions = [term_archive.session_for_term(a["term"])] if a["term"] else sharding.all_sessions()
+    if len(sessions) == 1:
+        count_q, page_q = student_data.catalog_stmts(a)
+        total = sessions[0].execute(count_q).scalar()
+        parts = [(sessions[0], sessions[0].execute(page_q).all())]
+    else:
+        # cross-shard page: merge each shard's first page*per_page rows
+        count_q, window_q = student_data.catalog_stmts(a, window=True)
+        total = sum(s.execute(count_q).scalar() for s in sessions)
+        parts = [(s, s.execute(window_q).all()) for s in sessions]
+        merged = heapq.merge(*(rows for _, rows in parts), key=student_data.catalog_sort_key(a),
+                             reverse=a["order"] == "desc")
+        keep = {r.id for r in islice(merged, (a["page"] - 1) * a["per_page"], a["page"] * a["per_page"])}
+        parts = [(s, [r for r in rows if r.id in keep]) for s, rows in parts]
+    stu_id = get_current_student().id
+    rows, slots, mine = [], [], []
+    for s, part in parts:
+        ids = [r.id for r in part]
+        rows += part
+        slots += s.execute(student_data.slots_stmt(ids)).all()
+        mine += s.execute(student_data.my_sections_stmt(stu_id, ids)).all()
+    rows.sort(key=student_data.catalog_sort_key(a), reverse=a["order"] == "desc")
+    return jsonify(student_data.shape_catalog(a, total, rows, slots, mine))
+
+@bp.get("/api/seats")
+@login_required
+@role_required("student")
+def api_seats():
+    term = (request.args.get("term") or "").strip()
+    sess = term_archive.session_for_term(term)
+    return jsonify(student_data.shape_seats(term, sess.execute(student_data.seats_stmt(term)).all()))
+
+@bp.get("/api/timetable")
+@login_required
+@role_required("student")
+def api_timetable():
+    stu = get_current_student()
+    term = (request.args.get("term") or "").strip() or my_terms(stu)[0]
+    sess = term_archive.session_for_term(term)
+    rows = sess.execute(student_data.timetable_stmt(stu.id, term)).all()
+    return jsonify(student_data.shape_timetable(term, rows))
+
+@bp.get("/api/grades")
+@login_required
+@role_required("student")
+def api_grades():
+    term = (request.args.get("term") or "").strip()
+    stmt = student_data.grades_stmt(get_current_student().id, term)
+    if term:
+        rows = term_archive.session_for_term(term).execute(stmt).all()
+    else:
+        rows = sorted(sharding.scatter(lambda s: s.execute(stmt).all()),
+                      key=lambda r: r.term, reverse=True)
+    return jsonify(student_data.shape_grades(term, rows))
+
+
+@bp.get("/api/transcript")
+@login_required
+@role_required("student")
+def api_transcript():
+    resp = jsonify(transcript.cached_transcript(get_current_student()))
+    resp.cache_control.private = True
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+# ---------- what-if planner (no writes until commit) ----------
+def run_plan(stu, args):
+    term = (args.get("term") or "").strip()
+    codes = [c.strip() for c in args.getlist("course") if c.strip()]
+    if args.get("courses"):
+        codes += [c.strip() for c in args["courses"].split(",") if c.strip()]
+    codes = list(dict.fromkeys(codes))
+    snap = planner.snapshot(term)
+    if not codes:
+        return snap, codes, [], 0, False
+    prefs = planner.Preferences.from_args(args)
+    base = planner.base_mask(sharding.session_for(term), snap, stu.id, set(codes))
+    limit = min(max(args.get("limit", type=int) or 20, 1), 100)
+    results, seen, truncated = planner.plans(snap, codes, prefs, base, limit)
+    return snap, codes, results, seen, truncated
+
+@bp.get("/plan")
+@login_required
+@role_required("student")
+def plan():
+    stu = get_current_student()
+    terms = term_archive.hot_terms()
+    args = request.args.copy()
+    args.setdefault("term", terms[0] if terms else "")
+    try:
+        snap, codes, results, seen, truncated = run_plan(stu, args)
+    except planner.PlanError as e:
+        flash(str(e))
+        snap, codes, results, seen, truncated = planner.snapshot(args["term"]), [], [], 0, False
+    courses = [(code, snap.info[snap.by_course[code][0]].course) for code in snap.courses]
+    return render_template("planner.html", term=args["term"], terms=terms, courses=courses,
+                           codes=codes, results=results, seen=seen, truncated=truncated,
+                           args=args)
+
+@bp.get("/api/plan")
+@login_required
+@role_required("student")
+def api_plan():
+    try:
+        snap, codes, results, seen, truncated = run_plan(get_current_student(), request.args)
+    except planner.PlanError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"term": snap.term, "courses": codes, "combinations": seen,
+                    "truncated": truncated, "plans": results})
+
+@bp.post("/plan/commit")
+@login_required
+@role_required("student")
+def commit_plan():
+    stu = get_current_student()
+    term = (request.form.get("term") or "").strip()
+    try:
+        added, dropped = planner.commit(stu.id, term, request.form.getlist("section_id", type=int))
+    except planner.PlanError as e:
+        flash(str(e))
+        return redirect(url_for("student.plan", term=term))
+    if dropped:
+        transcript.invalidate([stu.id])
+    seat_feed.publish_sections(added + dropped, session=sharding.session_for(term))
+    flash(f"Plan saved: {len(added)} enrolled, {len(dropped)} dropped")
+    return redirect(url_for("student.my_timetable", term=term))
+
+@bp.post("/api/plan/commit")
+@login_required
+@role_required("student")
+def api_commit_plan():
+    stu = get_current_student()
+    body = request.get_json(silent=True) or {}
+    term = (body.get("term") or "").strip()
+    try:
+        added, dropped = planner.commit(stu.id, term, body.get("sections") or [])
+    except (planner.PlanError, TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 409
+    if dropped:
+        transcript.invalidate([stu.id])
+    seat_feed.publish_sections(added + dropped, session=sharding.session_for(term))
+    return jsonify({"term": term, "enrolled": added, "dropped": dropped})
 
 @bp.route("/account", methods=["GET", "POST"])
 @login_required
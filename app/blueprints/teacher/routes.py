@@ -1,13 +1,14 @@
-from flask import render_template, request, redirect, url_for, flash
+from flask import render_template, request, redirect, url_for, flash, abort, jsonify, current_app
 from ...extensions import db
 from flask_login import login_required, current_user
 from app.blueprints.auth.routes import role_required
-from ...models import Section, Enrollment, Assessment, Grade, Teacher
+from ...models import Section, Assessment, Teacher
 from . import bp
 from sqlalchemy.orm import selectinload
-from sqlalchemy import func
-from sqlalchemy.exc import IntegrityError
 from werkzeug.security import check_password_hash, generate_password_hash
+from datetime import datetime
+from ...services import assessment_plan, grade_log, sharding
+from ...services import gradebook as gradebook_svc
 
 def get_current_teacher():
     return current_user.teacher
@@ -17,107 +18,147 @@ def get_current_teacher():
 @role_required("teacher")
 def my_sections():
     t = get_current_teacher()
-    secs = Section.query.options(
+    secs = sharding.scatter(lambda s: s.query(Section).options(
         selectinload(Section.course)
-    ).filter_by(teacher_id=t.id).order_by(Section.term.desc()).all()
+    ).filter_by(teacher_id=t.id).order_by(Section.term.desc()).all())
+    secs.sort(key=lambda s: s.term, reverse=True)
     return render_template("sections_teacher.html", sections=secs)
 
 @bp.route("/sections/<int:section_id>/assessments", methods=["GET","POST"])
 @login_required
 @role_required("teacher")
 def manage_assessments(section_id):
-    sec = db.session.get(Section, section_id)
+    sess, sec = sharding.locate(Section, section_id)
     if not sec:
         flash("Class does not exist")
         return redirect(url_for("teacher.sections"))
 
     if request.method == "POST":
-        title  = (request.form.get("title") or "").strip()
-        weight = request.form.get("weight", type=float)
-        full   = request.form.get("full_score", type=float)
-
-        if not title:
-            flash("Title is required")
-            return redirect(url_for("teacher.manage_assessments", section_id=section_id))
-        if weight is None or not (0 < weight <= 1):
-            flash("The weight must be between (0,1]")
-            return redirect(url_for("teacher.manage_assessments", section_id=section_id))
-        if full is None or full <= 0:
-            flash("The full score must be greater than 0")
-            return redirect(url_for("teacher.manage_assessments", section_id=section_id))
-
-        total = (db.session.query(func.coalesce(func.sum(Assessment.weight), 0.0))
-                 .filter(Assessment.section_id == section_id).scalar())
-        if total + weight > 1 + 1e-6:
-            flash("The sum of the weights of the assessment items in this class cannot exceed 1")
-            return redirect(url_for("teacher.manage_assessments", section_id=section_id))
-
-        db.session.add(Assessment(section_id=section_id, title=title, weight=weight, full_score=full))
         try:
-            db.session.commit()
-            flash("Added")
-        except IntegrityError:
-            db.session.rollback()
-            flash("Failed to save (possibly duplicate title)")
+            assessment_plan.apply(sess, section_id,
+                                  assessment_plan.parse_form(request.form, sec.assessments))
+            flash("Saved")
+        except assessment_plan.PlanError as e:
+            flash(str(e))
         return redirect(url_for("teacher.manage_assessments", section_id=section_id))
 
-    assessments = (Assessment.query
-                   .filter_by(section_id=section_id)
-                   .order_by(Assessment.id.asc()).all())
-    total = (db.session.query(func.coalesce(func.sum(Assessment.weight), 0.0))
-             .filter(Assessment.section_id == section_id).scalar())
-    return render_template("assessments.html",
-                           section=sec, assessments=assessments, total=total)
-    
+    return render_template("assessments.html", section=sec,
+                           assessments=sec.assessments, total=sec.weight_total)
+
+@bp.post("/sections/<int:section_id>/assessments/plan")
+@login_required
+@role_required("teacher")
+def assessment_plan_batch(section_id):
+    sess, sec = sharding.locate(Section, section_id)
+    if not sec:
+        return jsonify({"error": "Class does not exist"}), 404
+    batch = request.get_json(silent=True) or {}
+    if not isinstance(batch, dict):
+        return jsonify({"error": "Malformed batch"}), 400
+    try:
+        total = assessment_plan.apply(sess, section_id, batch)
+    except assessment_plan.PlanError as e:
+        return jsonify({"error": str(e)}), 409
+    except (TypeError, ValueError, KeyError):
+        return jsonify({"error": "Malformed batch"}), 400
+    return jsonify({"weight_total": total, "assessments": [
+        {"id": a.id, "title": a.title, "weight": a.weight, "full_score": a.full_score,
+         "position": a.position} for a in sec.assessments]})
+
 @bp.post("/assessments/<int:aid>/delete")
 @login_required
 @role_required("teacher")
 def delete_assessment(aid):
-    a = db.session.get(Assessment, aid)
+    sess, a = sharding.locate(Assessment, aid)
     if not a:
         flash("Does not exist"); return redirect(url_for("teacher.my_sections"))
     sid = a.section_id
-    db.session.delete(a); db.session.commit()
-    flash("Deleted")
+    try:
+        assessment_plan.apply(sess, sid, {"delete": [aid]})
+        flash("Deleted")
+    except assessment_plan.PlanError as e:
+        flash(str(e))
     return redirect(url_for("teacher.manage_assessments", section_id=sid))
 
+def gradebook_page():
+    page = max(request.args.get("page", type=int) or 1, 1)
+    per = min(max(request.args.get("per_page", type=int)
+                  or current_app.config["GRADEBOOK_PAGE_SIZE"], 1), 500)
+    return page, per
+
 @bp.route("/sections/<int:section_id>/gradebook", methods=["GET","POST"])
 @login_required
 @role_required("teacher")
 def gradebook(section_id):
-    sec = Section.query.options(
-        selectinload(Section.course),
-        selectinload(Section.assessments),
-        selectinload(Section.enrollments).selectinload(Enrollment.student),
-    ).get_or_404(section_id)
+    sess, sec = sharding.locate(Section, section_id)
+    if sec is None:
+        abort(404)
+    page, per = gradebook_page()
+    conflicts = {}
 
     if request.method == "POST":
-        for en in sec.enrollments:
-            for a in sec.assessments:
-                key = f"scores-{en.id}-{a.id}"
-                val = request.form.get(key)
-                if val is None or val == "":
-                    continue
-                try:
-                    score = float(val)
-                except ValueError:
-                    continue
-                g = Grade.query.filter_by(enrollment_id=en.id, assessment_id=a.id).one_or_none()
-                if g is None:
-                    g = Grade(enrollment_id=en.id, assessment_id=a.id, score=score)
-                    db.session.add(g)
-                else:
-                    g.score = score
-        db.session.commit()
-        flash("Saved scores")
-        return redirect(url_for("teacher.gradebook", section_id=section_id))
+        changes, lost, _ = gradebook_svc.save(sess, sec, gradebook_svc.parse_form(request.form),
+                                              actor_id=current_user.id)
+        flash(f"Saved scores ({len(changes)} changed)")
+        if not lost:
+            return redirect(url_for("teacher.gradebook", section_id=section_id,
+                                    page=page, per_page=per))
+        flash(f"{len(lost)} score(s) were changed by someone else and were not saved")
+        conflicts = {(c["enrollment_id"], c["assessment_id"]): c for c in lost}
+
+    at = None
+    if request.args.get("at"):
+        try:
+            at = datetime.fromisoformat(request.args["at"])
+        except ValueError:
+            flash("Time format must be YYYY-MM-DDTHH:MM")
+    total, rows, grades = gradebook_svc.block(sess, section_id, page, per)
+    if at is not None:
+        grade_map = grade_log.gradebook_at(sec.id, at)
+    else:
+        grade_map = {k: score for k, (score, _) in grades.items()}
+    versions = {k: v for k, (_, v) in grades.items()}
+
+    return render_template("gradebook.html", section=sec, rows=rows, grade_map=grade_map,
+                           versions=versions, conflicts=conflicts, at=at, page=page,
+                           per_page=per, total=total, pages=max((total + per - 1) // per, 1))
 
-    grade_map = {}
-    for en in sec.enrollments:
-        for g in en.grades:
-            grade_map[(en.id, g.assessment_id)] = g.score
+@bp.get("/sections/<int:section_id>/gradebook/cells")
+@login_required
+@role_required("teacher")
+def gradebook_cells(section_id):
+    sess, sec = sharding.locate(Section, section_id)
+    if sec is None:
+        abort(404)
+    page, per = gradebook_page()
+    total, rows, grades = gradebook_svc.block(sess, section_id, page, per)
+    return jsonify({
+        "page": page, "per_page": per, "total": total,
+        "assessments": [{"id": a.id, "title": a.title, "weight": a.weight,
+                         "full_score": a.full_score} for a in sec.assessments],
+        "students": [{"enrollment_id": r.id, "student_no": r.student_no, "name": r.name,
+                      "total": r.total} for r in rows],
+        "cells": [{"enrollment_id": eid, "assessment_id": aid, "score": score,
+                   "version": version} for (eid, aid), (score, version) in grades.items()],
+    })
 
-    return render_template("gradebook.html", section=sec, grade_map=grade_map)
+@bp.post("/sections/<int:section_id>/gradebook/cells")
+@login_required
+@role_required("teacher")
+def save_gradebook_cells(section_id):
+    sess, sec = sharding.locate(Section, section_id)
+    if sec is None:
+        return jsonify({"error": "Class does not exist"}), 404
+    try:
+        cells = [(int(c["enrollment_id"]), int(c["assessment_id"]), float(c["score"]),
+                  None if c.get("version") is None else int(c["version"]))
+                 for c in (request.get_json(silent=True) or {}).get("cells") or []]
+    except (TypeError, ValueError, KeyError, AttributeError):
+        return jsonify({"error": "Malformed cells"}), 400
+    changes, conflicts, versions = gradebook_svc.save(sess, sec, cells, actor_id=current_user.id)
+    return jsonify({"changed": len(changes), "conflicts": conflicts,
+                    "cells": [{"enrollment_id": eid, "assessment_id": aid, "version": v}
+                              for (eid, aid), v in versions.items()]})
 
 @bp.route("/account", methods=["GET", "POST"])
 @login_required
@@ -0,0 +1,206 @@
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+
+grades_cli = AppGroup("grades", help="Grade history maintenance.")
+
+@grades_cli.command("archive-term")
+@click.argument("term")
+def grades_archive_term(term):
+    """Move a closed term's grade events into its archive file."""
+    from .services import grade_log
+    n = grade_log.archive_term(term)
+    click.echo(f"archived {n} events -> {grade_log.archive_path(term)}")
+
+@grades_cli.command("compact")
+@click.option("--before", help="ISO datetime; defaults to the retention window")
+def grades_compact(before):
+    """Keep only the last event per cell for events older than --before."""
+    from .services import grade_log
+    n = grade_log.compact(datetime.fromisoformat(before) if before else None)
+    click.echo(f"compacted {n} events")
+
+terms_cli = AppGroup("terms", help="Term archiving.")
+
+@terms_cli.command("list")
+def terms_list():
+    """Show hot and archived terms."""
+    from .services import term_archive
+    for t in term_archive.hot_terms():
+        click.echo(f"{t}\thot")
+    for t in term_archive.archived_terms():
+        click.echo(f"{t}\tarchived")
+
+@terms_cli.command("archive")
+@click.argument("term")
+def terms_archive(term):
+    """Freeze a finished term into its own read-only SQLite file."""
+    from .services import term_archive
+    try:
+        counts = term_archive.archive_term(term)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"archived {term}: {counts}")
+
+@terms_cli.command("restore")
+@click.argument("term")
+def terms_restore(term):
+    """Move an archived term back into the hot tables."""
+    from .services import term_archive
+    try:
+        counts = term_archive.restore_term(term)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"restored {term}: {counts}")
+
+shards_cli = AppGroup("shards", help="Term-keyed sharding.")
+
+@shards_cli.command("list")
+def shards_list():
+    """Show each hot term's shard and load."""
+    from .services import sharding
+    for term, shard, secs, ens in sorted(sharding.term_loads()):
+        click.echo(f"{term}\t{shard}\t{secs} sections\t{ens} enrollments")
+
+@shards_cli.command("assign")
+@click.argument("term")
+@click.argument("shard")
+def shards_assign(term, shard):
+    """Place a new (empty) term on a shard."""
+    from .services import sharding
+    try:
+        sharding.assign(term, shard)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{term} -> {shard}")
+
+@shards_cli.command("move")
+@click.argument("term")
+@click.argument("shard")
+def shards_move(term, shard):
+    """Move a term's rows to another shard."""
+    from .services import sharding
+    try:
+        counts = sharding.move_term(term, shard)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"moved {term} -> {shard}: {counts}")
+
+@shards_cli.command("rebalance")
+@click.option("--apply", is_flag=True, help="Perform the moves instead of printing them")
+@click.option("--exclude-default", is_flag=True, help="Drain the main database")
+def shards_rebalance(apply, exclude_default):
+    """Spread terms across shards by sections + enrollments."""
+    from .services import sharding
+    for term, src, dest, w in sharding.plan_rebalance(include_default=not exclude_default):
+        click.echo(f"{term}\t{src} -> {dest}\t(weight {w})")
+        if apply:
+            sharding.move_term(term, dest)
+
+transcripts_cli = AppGroup("transcripts", help="Transcripts, GPA and standing lists.")
+
+@transcripts_cli.command("export")
+@click.option("--format", "fmt", type=click.Choice(["csv", "pdf"]), default="csv")
+@click.option("--out", required=True, help="CSV file, or directory for one PDF per student")
+@click.option("--student", "student_nos", multiple=True, help="Student No.; repeatable")
+def transcripts_export(fmt, out, student_nos):
+    """Generate transcripts for every student (or the given ones) in one pass."""
+    import csv
+    from pathlib import Path
+    from .extensions import db
+    from .models import Student
+    from .services import transcript
+    ids = None
+    if student_nos:
+        ids = db.session.execute(db.select(Student.id)
+                                 .where(Student.student_no.in_(student_nos))).scalars().all()
+    n = 0
+    if fmt == "csv":
+        with open(out, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(transcript.CSV_HEADER)
+            for t in transcript.transcripts(ids):
+                w.writerows(transcript.csv_rows(t)); n += 1
+    else:
+        d = Path(out); d.mkdir(parents=True, exist_ok=True)
+        for t in transcript.transcripts(ids):
+            (d / f"{t['student_no']}.pdf").write_bytes(transcript.pdf(transcript.text_lines(t)))
+            n += 1
+    click.echo(f"wrote {n} transcripts -> {out}")
+
+@transcripts_cli.command("honors")
+@click.argument("term")
+@click.option("--min-gpa", type=float)
+@click.option("--min-credits", type=int)
+def transcripts_honors(term, min_gpa, min_credits):
+    """List students on the honors list for TERM."""
+    from .services import transcript
+    for t, e in transcript.honors(term, min_gpa, min_credits):
+        click.echo(f"{t['student_no']}\t{t['student']}\t{e['credits']}\t{e['gpa']}")
+
+@transcripts_cli.command("probation")
+@click.option("--max-gpa", type=float)
+def transcripts_probation(max_gpa):
+    """List students whose cumulative GPA is below the probation bar."""
+    from .services import transcript
+    for t in transcript.probation(max_gpa):
+        click.echo(f"{t['student_no']}\t{t['student']}\t{t['credits']}\t{t['gpa']}")
+
+assessments_cli = AppGroup("assessments", help="Assessment plans.")
+
+@assessments_cli.command("resync")
+def assessments_resync():
+    """Rebuild section weight totals and stored enrollment totals."""
+    from .services import assessment_plan, sharding
+    for sess in sharding.all_sessions():
+        sections, enrollments = assessment_plan.resync(sess)
+        click.echo(f"{sections} sections, {enrollments} enrollments")
+
+enrollments_cli = AppGroup("enrollments", help="Bulk enrollment.")
+
+@enrollments_cli.command("import")
+@click.argument("pairs_csv", type=click.File(encoding="utf-8"))
+@click.option("--dry-run", is_flag=True, help="Run every check without enrolling anyone")
+@click.option("--report", type=click.Path(dir_okay=False), help="Write one result row per pair")
+def enrollments_import(pairs_csv, dry_run, report):
+    """Enroll the (student_no, section_id) pairs of a CSV file."""
+    import csv
+    from .services import bulk_enroll
+    try:
+        pairs = bulk_enroll.parse_csv(pairs_csv)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    results, summary = bulk_enroll.enroll(pairs, dry_run=dry_run)
+    if report:
+        with open(report, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, bulk_enroll.REPORT_HEADER)
+            w.writeheader(); w.writerows(results)
+    for status, n in sorted(summary.items()):
+        click.echo(f"{status}\t{n}")
+
+profiles_cli = AppGroup("profiles", help="Request profiling.")
+
+@profiles_cli.command("token")
+@click.option("--by", default="cli", help="Recorded in the token")
+def profiles_token(by):
+    """Print a header that profiles any request carrying it."""
+    from flask import current_app
+    from .services import profiler
+    click.echo(f"{current_app.config['PROFILE_HEADER']}: {profiler.make_token(by)}")
+
+@profiles_cli.command("list")
+def profiles_list():
+    """List stored profiles, newest first."""
+    from .services import profiler
+    for p in profiler.summaries():
+        click.echo(f"{p['id']}\t{p['status']}\t{p['wall_ms']}ms\t{p['cpu_ms']}ms cpu\t"
+                   f"{p['sql_count']} sql\t{p['method']} {p['path']}")
+
+def register_commands(app):
+    app.cli.add_command(grades_cli)
+    app.cli.add_command(terms_cli)
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(transcripts_cli)
+    app.cli.add_command(assessments_cli)
+    app.cli.add_command(enrollments_cli)
+    app.cli.add_command(profiles_cli)
@@ -1,10 +1,12 @@
 from ..extensions import db
 from .people import Student, Teacher
 from .course import Course, Section, Timeslot
-from .enrollment import Enrollment, Assessment, Grade
+from .enrollment import Enrollment, Assessment, Grade, GradeEvent
 from .user import User
+from .term import TermArchive, TermShard, ShardIdBlock
 
 __all__ = [
     "Student", "Teacher", "Course", "Section", "Timeslot",
-    "Enrollment", "Assessment", "Grade", "User",
+    "Enrollment", "Assessment", "Grade", "GradeEvent", "User",
+    "TermArchive", "TermShard", "ShardIdBlock",
 ]
\ No newline at end of file
@@ -16,6 +16,8 @@ class Section(db.Model):
     teacher_id = db.Column(db.Integer, db.ForeignKey("teacher.id"), nullable=False)
     term = db.Column(db.String(16), nullable=False)  # 例如 "2025S"
     capacity = db.Column(db.Integer, default=60)
+    # SUM(assessment.weight), kept by services.assessment_plan in the same write
+    weight_total = db.Column(db.Float, nullable=False, default=0.0, server_default="0")
 
     course = db.relationship("Course", back_populates="sections")
     teacher = db.relationship("Teacher", back_populates="sections")
@@ -24,7 +26,8 @@ class Section(db.Model):
     timeslots = db.relationship("Timeslot", back_populates="section",
                                 cascade="all, delete-orphan")
     assessments = db.relationship("Assessment", back_populates="section",
-                                  cascade="all, delete-orphan")
+                                  cascade="all, delete-orphan",
+                                  order_by="(Assessment.position, Assessment.id)")
 
 class Timeslot(db.Model):
     __tablename__ = "timeslot"
@@ -6,6 +6,7 @@ class Enrollment(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey("student.id"), nullable=False)
     section_id = db.Column(db.Integer, db.ForeignKey("section.id"), nullable=False)
     status = db.Column(db.String(16), nullable=False, default="enrolled")
+    total = db.Column(db.Float)    # weighted percent; None until something is graded
     __table_args__ = (
         db.UniqueConstraint("student_id", "section_id", name="uq_student_section"),
     )
@@ -23,6 +24,7 @@ class Assessment(db.Model):
     weight = db.Column(db.Float, nullable=False)           # 0~1
     full_score = db.Column(db.Float, nullable=False, default=100.0)
     due_at = db.Column(db.DateTime)
+    position = db.Column(db.Integer, nullable=False, default=0, server_default="0")
     __table_args__ = (
         db.UniqueConstraint("section_id", "title", name="uq_assessment_title"),
         db.CheckConstraint("weight >= 0 AND weight <= 1", name="ck_weight_0_1"),
@@ -40,9 +42,27 @@ class Grade(db.Model):
     score = db.Column(db.Float, nullable=False, default=0.0)
     commented_at = db.Column(db.DateTime)
     remark = db.Column(db.String(255))
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")  # bumped per write
     __table_args__ = (
         db.UniqueConstraint("enrollment_id", "assessment_id", name="uq_enroll_assessment"),
     )
 
     enrollment = db.relationship("Enrollment", back_populates="grades")
-    assessment = db.relationship("Assessment", back_populates="grades")
\ No newline at end of file
+    assessment = db.relationship("Assessment", back_populates="grades")
+
+class GradeEvent(db.Model):
+    __tablename__ = "grade_event"
+    # append-only: no FKs so history survives drops and assessment deletes
+    id = db.Column(db.Integer, primary_key=True)
+    section_id = db.Column(db.Integer, nullable=False)
+    enrollment_id = db.Column(db.Integer, nullable=False)
+    assessment_id = db.Column(db.Integer, nullable=False)
+    actor_id = db.Column(db.Integer)                        # user.id
+    batch_id = db.Column(db.String(32), nullable=False)
+    at = db.Column(db.DateTime, nullable=False)
+    old_score = db.Column(db.Float)                         # None = cell was empty
+    new_score = db.Column(db.Float, nullable=False)
+    __table_args__ = (
+        db.Index("ix_grade_event_section_at", "section_id", "at"),
+        db.Index("ix_grade_event_cell", "enrollment_id", "assessment_id"),
+    )
@@ -0,0 +1,21 @@
+from ..extensions import db
+
+class TermArchive(db.Model):
+    __tablename__ = "term_archive"
+    id = db.Column(db.Integer, primary_key=True)
+    term = db.Column(db.String(16), unique=True, nullable=False)
+    path = db.Column(db.String(255), nullable=False)       # archive SQLite file
+    archived_at = db.Column(db.DateTime, nullable=False)
+    sections = db.Column(db.Integer, nullable=False, default=0)
+    enrollments = db.Column(db.Integer, nullable=False, default=0)
+
+class TermShard(db.Model):
+    __tablename__ = "term_shard"
+    # global directory: terms not listed here live in the main database
+    term = db.Column(db.String(16), primary_key=True)
+    shard = db.Column(db.String(32), nullable=False)
+
+class ShardIdBlock(db.Model):
+    __tablename__ = "shard_id_block"
+    name = db.Column(db.String(32), primary_key=True)       # table name
+    next_id = db.Column(db.Integer, nullable=False)
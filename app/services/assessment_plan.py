@@ -0,0 +1,198 @@
+"""Assessment plans: a section's weighted items, edited as one batch.
+
+``section.weight_total`` mirrors ``SUM(assessment.weight)``.  A batch first
+moves it with a single conditional UPDATE whose WHERE re-checks the limit
+against the weights being replaced, read inside that same statement, so two
+editors racing each other cannot push a section over 1: the loser's UPDATE
+matches no row and its whole batch is rolled back.  The items themselves are
+then created, reweighted, reordered and deleted in the same transaction; an
+item another editor deleted before the guarded UPDATE makes its statement
+match no row, which also rolls the batch back, so the total cannot drift.
+``enrollment.total`` is recomputed for the section in one statement.
+
+A batch is a dict::
+
+    {"create": [{"title", "weight", "full_score"}],
+     "update": [{"id", "title"?, "weight"?, "full_score"?}],
+     "delete": [id, ...],
+     "order":  [id, ...]}          # new display order of existing items
+"""
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from ..models import Assessment, Enrollment, Grade, Section
+from . import sharding, transcript
+
+EPS = 1e-6
+STALE = "The assessment items were changed by someone else; reload and try again"
+
+
+class PlanError(ValueError):
+    pass
+
+
+def _float(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _check_item(item, partial=False):
+    if "title" in item or not partial:
+        item["title"] = (item.get("title") or "").strip()
+        if not item["title"]:
+            raise PlanError("Title is required")
+    if "weight" in item or not partial:
+        item["weight"] = _float(item.get("weight"))
+        if item["weight"] is None or not (0 < item["weight"] <= 1):
+            raise PlanError("The weight must be between (0,1]")
+    if "full_score" in item or not partial:
+        item["full_score"] = _float(item.get("full_score", 100))
+        if item["full_score"] is None or item["full_score"] <= 0:
+            raise PlanError("The full score must be greater than 0")
+    return item
+
+
+def parse_form(form, assessments):
+    """Batch from the assessments page form (per-row inputs + one new row).
+
+    Only fields that differ from ``assessments`` (the current items, in
+    display order) end up in the batch.
+    """
+    batch = {"create": [], "update": [], "delete": [], "order": []}
+    order = []
+    for a in assessments:
+        if form.get(f"delete-{a.id}"):
+            batch["delete"].append(a.id)
+            continue
+        item = {"id": a.id}
+        title = form.get(f"title-{a.id}")
+        if title is not None and title.strip() != a.title:
+            item["title"] = title
+        for field in ("weight", "full_score"):
+            val = form.get(f"{field}-{a.id}")
+            if val is not None and _float(val) != getattr(a, field):
+                item[field] = val
+        if len(item) > 1:
+            batch["update"].append(item)
+        pos = _float(form.get(f"position-{a.id}"))
+        order.append((pos if pos is not None else float("inf"), a.id))
+    order = [aid for _, aid in sorted(order)]
+    if order != [a.id for a in assessments if a.id not in batch["delete"]]:
+        batch["order"] = order
+    if (form.get("title") or "").strip():
+        batch["create"].append({"title": form["title"], "weight": form.get("weight"),
+                                "full_score": form.get("full_score") or 100})
+    return batch
+
+
+def apply(sess, section_id, batch):
+    """Apply a batch atomically; returns the new weight total.
+
+    Raises ``PlanError`` (after rolling back) if it is invalid, would push
+    the section over 1, or collides on a title.
+    """
+    creates = [_check_item(dict(c)) for c in batch.get("create") or []]
+    updates = [_check_item(dict(u), partial=True) for u in batch.get("update") or []]
+    deletes = [int(i) for i in batch.get("delete") or []]
+    order = [int(i) for i in batch.get("order") or []]
+
+    ids = set(sess.execute(select(Assessment.id)
+                           .where(Assessment.section_id == section_id)).scalars())
+    touched = {int(u["id"]) for u in updates} | set(deletes) | set(order)
+    if touched - ids:
+        raise PlanError("Assessment item does not belong to this class")
+    if {int(u["id"]) for u in updates} & set(deletes) or set(order) & set(deletes):
+        raise PlanError("An assessment item cannot be edited and deleted at once")
+
+    replaced = {int(u["id"]) for u in updates if "weight" in u} | set(deletes)
+    added = sum(c["weight"] for c in creates) + sum(u["weight"] for u in updates if "weight" in u)
+    old = (select(func.coalesce(func.sum(Assessment.weight), 0.0))
+           .where(Assessment.section_id == section_id, Assessment.id.in_(replaced))
+           .scalar_subquery())
+    new_total = Section.weight_total + added - old
+    try:
+        res = sess.execute(update(Section)
+                           .where(Section.id == section_id, new_total <= 1 + EPS)
+                           .values(weight_total=new_total)
+                           .execution_options(synchronize_session=False))
+        if res.rowcount == 0:
+            raise PlanError("The sum of the weights of the assessment items in this class cannot exceed 1")
+
+        if deletes:
+            sess.execute(delete(Grade).where(Grade.assessment_id.in_(deletes)))
+            res = sess.execute(delete(Assessment)
+                               .where(Assessment.section_id == section_id,
+                                      Assessment.id.in_(deletes)))
+            if res.rowcount != len(set(deletes)):
+                raise PlanError(STALE)
+        for u in updates:
+            values = {k: u[k] for k in ("title", "weight", "full_score") if k in u}
+            res = sess.execute(update(Assessment)
+                               .where(Assessment.section_id == section_id,
+                                      Assessment.id == int(u["id"]))
+                               .values(**values)
+                               .execution_options(synchronize_session=False))
+            if res.rowcount != 1:
+                raise PlanError(STALE)
+        if order:
+            # ORM bulk UPDATE by primary key: one executemany
+            sess.execute(update(Assessment), [{"id": aid, "position": i}
+                                              for i, aid in enumerate(order)])
+        if creates:
+            start = len(order) if order else 1 + sess.execute(
+                select(func.coalesce(func.max(Assessment.position), -1))
+                .where(Assessment.section_id == section_id)).scalar()
+            sess.execute(insert(Assessment), sharding.assign_ids(Assessment, [
+                {"section_id": section_id, "title": c["title"], "weight": c["weight"],
+                 "full_score": c["full_score"], "position": start + i}
+                for i, c in enumerate(creates)], session=sess))
+        students = None
+        if deletes or any("weight" in u or "full_score" in u for u in updates):
+            recompute_totals(sess, section_id)
+            students = sess.execute(select(Enrollment.student_id)
+                                    .where(Enrollment.section_id == section_id)).scalars().all()
+        total = sess.execute(select(Section.weight_total)
+                             .where(Section.id == section_id)).scalar()
+        sess.commit()
+    except IntegrityError:
+        sess.rollback()
+        raise PlanError("Failed to save (possibly duplicate title)")
+    except PlanError:
+        sess.rollback()
+        raise
+    sess.expire_all()
+    if students:
+        transcript.invalidate(students)
+    return total
+
+
+def _percent():
+    # correlated to the enrollment row being updated; NULL when nothing is graded
+    return (select(func.sum(Grade.score / Assessment.full_score * Assessment.weight) * 100)
+            .select_from(Grade)
+            .join(Assessment, Grade.assessment_id == Assessment.id)
+            .where(Grade.enrollment_id == Enrollment.id)
+            .scalar_subquery())
+
+
+def recompute_totals(sess, section_id, enrollment_ids=None):
+    """Rewrite ``enrollment.total`` for a section (or some of its enrollments)."""
+    percent = _percent()
+    q = update(Enrollment).where(Enrollment.section_id == section_id)
+    if enrollment_ids is not None:
+        q = q.where(Enrollment.id.in_(enrollment_ids))
+    sess.execute(q.values(total=percent).execution_options(synchronize_session=False))
+
+
+def resync(sess):
+    """Rebuild every weight total and enrollment total in ``sess`` (one shard)."""
+    weights = (select(func.coalesce(func.sum(Assessment.weight), 0.0))
+               .where(Assessment.section_id == Section.id).scalar_subquery())
+    sections = sess.execute(update(Section).values(weight_total=weights)
+                            .execution_options(synchronize_session=False)).rowcount
+    enrollments = sess.execute(update(Enrollment).values(total=_percent())
+                               .execution_options(synchronize_session=False)).rowcount
+    sess.commit()
+    return sections, enrollments
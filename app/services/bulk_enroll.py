@@ -0,0 +1,167 @@
+"""Bulk enrollment of (student number, section id) pairs.
+
+Pairs are grouped by term, so each group runs on one shard.  For every term
+the seats taken, the timeslots involved and the students' current
+enrollments are loaded once, and each pair is checked in memory, in input
+order (earlier pairs win seats and times): capacity by a running count per
+section, time conflicts by week bitmasks (``planner.section_masks``) per
+student.  Accepted pairs are inserted ``BULK_ENROLL_CHUNK`` at a time with
+``INSERT ... ON CONFLICT DO NOTHING`` on ``uq_student_section``, so running
+the same file twice enrolls nobody twice.  Before each chunk commits, its
+sections are re-counted inside the write transaction and any seats that
+concurrent enrollments took in the meantime are given back.
+
+Every pair gets one result: ``enrolled``, ``already``, ``full``,
+``conflict``, ``unknown_student`` or ``unknown_section``.
+"""
+import csv
+from collections import Counter, defaultdict
+
+from flask import current_app
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from ..extensions import db
+from ..models import Enrollment, Section, Student
+from . import planner, seat_feed, sharding
+
+IN_CHUNK = 900      # ids per IN (...) list, under SQLite's bound-parameter limit
+REPORT_HEADER = ("student_no", "section_id", "status", "detail")
+
+
+def _chunks(seq, n):
+    seq = list(seq)
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+
+def _select_in(sess, build, ids):
+    for part in _chunks(ids, IN_CHUNK):
+        yield from sess.execute(build(part))
+
+
+def parse_csv(lines):
+    """``[(student_no, section_id)]`` from CSV lines; a header row is skipped."""
+    pairs = []
+    for n, row in enumerate(csv.reader(lines), 1):
+        if not row or not "".join(row).strip():
+            continue
+        try:
+            if len(row) < 2:
+                raise ValueError
+            pairs.append((row[0].strip(), int(row[1])))
+        except ValueError:
+            if n == 1:
+                continue
+            raise ValueError(f"line {n}: expected student_no,section_id")
+    return pairs
+
+
+def enroll(pairs, dry_run=False):
+    """Enroll ``pairs``; returns ``(results, summary)`` with one result per pair.
+
+    With ``dry_run`` every check runs but nothing is written.
+    """
+    pairs = [(str(no).strip(), int(sid)) for no, sid in pairs]
+    students = dict(_select_in(db.session, lambda part: select(Student.student_no, Student.id)
+                               .where(Student.student_no.in_(part)), {no for no, _ in pairs}))
+    wanted = {sid for _, sid in pairs}
+    sections = {}
+    for sess in sharding.all_sessions():
+        for r in _select_in(sess, lambda part: select(Section.id, Section.term, Section.capacity)
+                            .where(Section.id.in_(part)), wanted):
+            sections[r.id] = r
+
+    outcome = {}
+    by_term = defaultdict(list)
+    for i, (no, sid) in enumerate(pairs):
+        if no not in students:
+            outcome[i] = ("unknown_student", None)
+        elif sid not in sections:
+            outcome[i] = ("unknown_section", None)
+        else:
+            by_term[sections[sid].term].append((i, students[no], sid))
+    for term, items in by_term.items():
+        outcome.update(_enroll_term(sharding.session_for(term), term, items, sections, dry_run))
+
+    results = [{"student_no": no, "section_id": sid, "status": outcome[i][0],
+                "detail": outcome[i][1]} for i, (no, sid) in enumerate(pairs)]
+    return results, Counter(r["status"] for r in results)
+
+
+def _enroll_term(sess, term, items, sections, dry_run):
+    """Check and insert one term's ``(index, student_id, section_id)`` items."""
+    sids = {sid for _, _, sid in items}
+    taken = Counter(dict(_select_in(
+        sess, lambda part: select(Enrollment.section_id, func.count(Enrollment.id))
+        .where(Enrollment.section_id.in_(part)).group_by(Enrollment.section_id), sids)))
+    held = defaultdict(set)
+    for r in _select_in(sess, lambda part: select(Enrollment.student_id, Enrollment.section_id)
+                        .join(Section, Enrollment.section_id == Section.id)
+                        .where(Section.term == term, Enrollment.student_id.in_(part)),
+                        {st for _, st, _ in items}):
+        held[r.student_id].add(r.section_id)
+    masks = {}
+    for part in _chunks(sids.union(*held.values()), IN_CHUNK):
+        masks.update(planner.section_masks(sess, part))
+    week = {st: 0 for _, st, _ in items}
+    for st, mine in held.items():
+        for sid in mine:
+            week[st] |= masks.get(sid, 0)
+
+    out, accepted = {}, []
+    for i, st, sid in items:
+        m = masks.get(sid, 0)
+        if sid in held[st]:
+            out[i] = ("already", None)
+        elif taken[sid] >= (sections[sid].capacity or 0):
+            out[i] = ("full", None)
+        elif week[st] & m:
+            other = next(h for h in held[st] if masks.get(h, 0) & m)
+            out[i] = ("conflict", f"overlaps section {other}")
+        else:
+            held[st].add(sid)
+            week[st] |= m
+            taken[sid] += 1
+            out[i] = ("enrolled", None)
+            accepted.append((i, st, sid))
+    if not dry_run:
+        for chunk in _chunks(accepted, current_app.config["BULK_ENROLL_CHUNK"]):
+            _insert_chunk(sess, chunk, sections, out)
+    return out
+
+
+def _insert_chunk(sess, chunk, sections, out):
+    rows = sharding.assign_ids(Enrollment, [
+        {"student_id": st, "section_id": sid, "status": "enrolled"} for _, st, sid in chunk],
+        session=sess)
+    stmt = (sqlite_insert(Enrollment)
+            .on_conflict_do_nothing(index_elements=["student_id", "section_id"])
+            .returning(Enrollment.id, Enrollment.student_id, Enrollment.section_id))
+    try:
+        inserted = {(r.student_id, r.section_id): r.id for r in sess.execute(stmt, rows)}
+        for i, st, sid in chunk:
+            if (st, sid) not in inserted:
+                out[i] = ("already", None)
+
+        sids = {sid for _, _, sid in chunk}
+        counts = dict(sess.execute(select(Enrollment.section_id, func.count(Enrollment.id))
+                                   .where(Enrollment.section_id.in_(sids))
+                                   .group_by(Enrollment.section_id)).all())
+        undo = []
+        for sid in sids:
+            over = counts.get(sid, 0) - (sections[sid].capacity or 0)
+            for i, st, s in reversed(chunk):
+                if over <= 0:
+                    break
+                if s == sid and (st, sid) in inserted:
+                    undo.append(inserted[(st, sid)])
+                    out[i] = ("full", None)
+                    over -= 1
+        if undo:
+            sess.execute(delete(Enrollment).where(Enrollment.id.in_(undo)))
+        sess.commit()
+    except Exception:
+        sess.rollback()
+        raise
+    seat_feed.publish_sections(sorted(sids), session=sess)
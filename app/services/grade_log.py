@@ -0,0 +1,230 @@
+"""Append-only grade change log.
+
+Every gradebook save writes one event per changed cell (who, when, old, new,
+batch id) in the same transaction as the grade rows.  Closed terms can be
+moved out of the live table into a compact columnar archive file, and old
+events can be compacted down to the last change per cell.
+"""
+import math
+import struct
+import sys
+import uuid
+import zlib
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+
+from ..extensions import db
+from ..models import GradeEvent, Section
+from . import sharding, term_archive
+
+EVENT_FIELDS = ("id", "section_id", "enrollment_id", "assessment_id", "actor_id",
+                "batch_id", "at", "old_score", "new_score")
+EPOCH = datetime(1970, 1, 1)
+ARCHIVE_MAGIC = b"GEV1"
+# (column, array typecode); batch ids are packed separately as 16 raw bytes
+ARCHIVE_COLUMNS = (
+    ("id", "q"), ("section_id", "i"), ("enrollment_id", "i"),
+    ("assessment_id", "i"), ("actor_id", "i"), ("at", "d"),
+    ("old_score", "d"), ("new_score", "d"),
+)
+
+
+def utcnow():
+    return datetime.utcnow()
+
+
+def record_changes(section_id, changes, actor_id=None, at=None, session=None):
+    """Queue one event per (enrollment_id, assessment_id, old, new) change.
+
+    Nothing is committed here: the caller commits the events together with
+    the grade rows (in ``session``, the section's shard) so the log and the
+    gradebook never disagree.
+    """
+    if not changes:
+        return None
+    batch_id = uuid.uuid4().hex
+    at = at or utcnow()
+    session = session or db.session
+    session.flush()
+    session.execute(insert(GradeEvent), sharding.assign_ids(GradeEvent, [
+        {"section_id": section_id, "enrollment_id": eid, "assessment_id": aid,
+         "actor_id": actor_id, "batch_id": batch_id, "at": at,
+         "old_score": old, "new_score": new}
+        for eid, aid, old, new in changes
+    ], session=session))
+    return batch_id
+
+
+def archive_dir():
+    return Path(current_app.config["GRADE_ARCHIVE_DIR"])
+
+
+def archive_path(term):
+    return archive_dir() / f"grade_events-{term}.gev"
+
+
+def _event_dict(e):
+    return {c: getattr(e, c) for c in EVENT_FIELDS}
+
+
+def _key(e):
+    # ids alone can be reused after deletes; batch ids are unique per save
+    return e["id"], e["batch_id"]
+
+
+def _row(e):
+    return (e["id"], e["section_id"], e["enrollment_id"], e["assessment_id"],
+            e["actor_id"] if e["actor_id"] is not None else -1,
+            (e["at"] - EPOCH).total_seconds(),
+            e["old_score"] if e["old_score"] is not None else math.nan,
+            e["new_score"], e["batch_id"])
+
+
+def _pack(rows):
+    n = len(rows)
+    out = [struct.pack("<4sI", ARCHIVE_MAGIC, n)]
+    for idx, (_, code) in enumerate(ARCHIVE_COLUMNS):
+        col = array(code, (r[idx] for r in rows))
+        if sys.byteorder == "big":
+            col.byteswap()
+        raw = col.tobytes()
+        out.append(struct.pack("<cI", code.encode(), len(raw)))
+        out.append(raw)
+    batches = b"".join(bytes.fromhex(r[-1]) for r in rows)
+    out.append(struct.pack("<cI", b"B", len(batches)))
+    out.append(batches)
+    return zlib.compress(b"".join(out), 9)
+
+
+def _unpack(blob):
+    buf = memoryview(zlib.decompress(blob))
+    magic, n = struct.unpack_from("<4sI", buf, 0)
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError("not a grade event archive")
+    pos = 8
+    cols = {}
+    for name, code in ARCHIVE_COLUMNS:
+        _, size = struct.unpack_from("<cI", buf, pos); pos += 5
+        col = array(code); col.frombytes(buf[pos:pos + size]); pos += size
+        if sys.byteorder == "big":
+            col.byteswap()
+        cols[name] = col
+    _, size = struct.unpack_from("<cI", buf, pos); pos += 5
+    raw = bytes(buf[pos:pos + size])
+    cols["batch_id"] = [raw[i * 16:(i + 1) * 16].hex() for i in range(n)]
+    return n, cols
+
+
+def read_archive(path):
+    """Yield archived events as dicts, in the order they were written."""
+    n, cols = _unpack(Path(path).read_bytes())
+    for i in range(n):
+        old = cols["old_score"][i]
+        actor = cols["actor_id"][i]
+        yield {
+            "id": cols["id"][i],
+            "section_id": cols["section_id"][i],
+            "enrollment_id": cols["enrollment_id"][i],
+            "assessment_id": cols["assessment_id"][i],
+            "actor_id": actor if actor >= 0 else None,
+            "batch_id": cols["batch_id"][i],
+            "at": EPOCH + timedelta(seconds=cols["at"][i]),
+            "old_score": None if math.isnan(old) else old,
+            "new_score": cols["new_score"][i],
+        }
+
+
+def archive_term(term):
+    """Move a closed term's events from the live table into its archive file.
+
+    Re-archiving a term merges the new events into the existing file.  The
+    file is replaced before the live rows are deleted; events are keyed by
+    ``(id, batch_id)``, so if that delete fails, running this again (and any
+    reader in the meantime) sees each event once.  Returns the number of
+    events moved.
+    """
+    sess = sharding.session_for(term)
+    section_ids = select(Section.id).where(Section.term == term)
+    events = (sess.execute(
+        select(GradeEvent).where(GradeEvent.section_id.in_(section_ids))
+        .order_by(GradeEvent.id)).scalars().all())
+    if not events:
+        return 0
+    path = archive_path(term)
+    rows = {_key(e): e for e in read_archive(path)} if path.exists() else {}
+    for e in map(_event_dict, events):
+        rows.setdefault(_key(e), e)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(_pack([_row(e) for e in rows.values()]))
+    tmp.replace(path)
+    sess.execute(delete(GradeEvent)
+                 .where(GradeEvent.id.in_([e.id for e in events])))
+    sess.commit()
+    return len(events)
+
+
+def compact(before=None):
+    """Collapse live events older than ``before`` to the last one per cell.
+
+    Point-in-time reconstruction stays exact for any moment >= ``before``.
+    Defaults to the configured retention window.  Returns rows deleted.
+    """
+    if before is None:
+        days = current_app.config["GRADE_EVENT_RETENTION_DAYS"]
+        before = utcnow() - timedelta(days=days)
+    # last by (at, id) like section_events: allocator ids are not time-ordered
+    ranked = (select(GradeEvent.id, func.row_number().over(
+                  partition_by=(GradeEvent.enrollment_id, GradeEvent.assessment_id),
+                  order_by=(GradeEvent.at.desc(), GradeEvent.id.desc())).label("n"))
+              .where(GradeEvent.at < before).subquery())
+    keep = select(ranked.c.id).where(ranked.c.n == 1)
+    deleted = 0
+    for sess in sharding.all_sessions():
+        res = sess.execute(delete(GradeEvent).where(
+            GradeEvent.at < before, GradeEvent.id.not_in(keep)))
+        sess.commit()
+        deleted += res.rowcount
+    return deleted
+
+
+def section_events(section_id, until=None, term=None):
+    """All events of one section (archive + live), oldest first.
+
+    Pass ``term`` for a section of an archived term; its live events moved
+    into the term's archive database with it.
+    """
+    if term is None:
+        sess, sec = sharding.locate(Section, section_id)
+        term = sec.term if sec is not None else None
+    else:
+        sess = term_archive.session_for_term(term)
+    events = {}
+    if term is not None:
+        path = archive_path(term)
+        if path.exists():
+            events = {_key(e): e for e in read_archive(path)
+                      if e["section_id"] == section_id}
+    q = select(GradeEvent).where(GradeEvent.section_id == section_id)
+    if until is not None:
+        q = q.where(GradeEvent.at <= until)
+    for e in sess.execute(q.order_by(GradeEvent.id)).scalars():
+        e = _event_dict(e)
+        events.setdefault(_key(e), e)
+    events = list(events.values())
+    if until is not None:
+        events = [e for e in events if e["at"] <= until]
+    events.sort(key=lambda e: (e["at"], e["id"]))
+    return events
+
+
+def gradebook_at(section_id, when, term=None):
+    """Reconstruct ``{(enrollment_id, assessment_id): score}`` as of ``when``."""
+    state = {}
+    for e in section_events(section_id, until=when, term=term):
+        state[(e["enrollment_id"], e["assessment_id"])] = e["new_score"]
+    return state
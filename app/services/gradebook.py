@@ -0,0 +1,131 @@
+"""Gradebook blocks and sparse, versioned cell saves.
+
+The gradebook is read one block of students at a time (ordered by student
+number) and saved as a list of changed cells only.  Every grade row carries
+a ``version`` that each write bumps; a cell is submitted with the version it
+was read at (``0`` for an empty cell) and is written with a conditional
+UPDATE (or an ``INSERT ... ON CONFLICT DO NOTHING`` for new cells).  A cell
+that someone else changed in the meantime is reported back as a conflict
+instead of being overwritten; the other cells of the batch are still saved.
+
+A cell is ``(enrollment_id, assessment_id, score, version)``; ``version`` may
+be None for callers that want last-writer-wins.
+"""
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from ..models import Enrollment, Grade, Student
+from . import assessment_plan, grade_log, sharding, transcript
+
+
+def block(sess, section_id, page, per_page):
+    """``(total, enrollment rows, {(eid, aid): (score, version)})`` for one page."""
+    total = sess.execute(select(func.count(Enrollment.id))
+                         .where(Enrollment.section_id == section_id)).scalar()
+    rows = sess.execute(
+        select(Enrollment.id, Enrollment.total, Student.name, Student.student_no)
+        .join(Student, Enrollment.student_id == Student.id)
+        .where(Enrollment.section_id == section_id)
+        .order_by(Student.student_no, Enrollment.id)
+        .offset((page - 1) * per_page).limit(per_page)).all()
+    grades = {}
+    if rows:
+        for g in sess.execute(select(Grade.enrollment_id, Grade.assessment_id,
+                                     Grade.score, Grade.version)
+                              .where(Grade.enrollment_id.in_([r.id for r in rows]))):
+            grades[(g.enrollment_id, g.assessment_id)] = (g.score, g.version)
+    return total, rows, grades
+
+
+def parse_form(form):
+    """Cells from ``scores-<eid>-<aid>[-<version>]`` inputs; blanks are skipped."""
+    cells = []
+    for key, val in form.items():
+        parts = key.split("-")
+        if parts[0] != "scores" or len(parts) not in (3, 4) or not val.strip():
+            continue
+        try:
+            version = int(parts[3]) if len(parts) == 4 else None
+            cells.append((int(parts[1]), int(parts[2]), float(val), version))
+        except ValueError:
+            continue
+    return cells
+
+
+def _conflict(eid, aid, yours, theirs, version, reason="changed"):
+    return {"enrollment_id": eid, "assessment_id": aid, "yours": yours,
+            "theirs": theirs, "version": version, "reason": reason}
+
+
+def save(sess, section, cells, actor_id=None):
+    """Write changed cells in one transaction.
+
+    Returns ``(changes, conflicts, versions)``: the ``(eid, aid, old, new)``
+    changes that were written, per-cell conflict dicts, and the current
+    version of every submitted cell that was saved or already up to date.
+    """
+    cells = {(eid, aid): (score, version) for eid, aid, score, version in cells}
+    if not cells:
+        return [], [], {}
+    eids = {k[0] for k in cells}
+    aids = {k[1] for k in cells}
+    students = dict(sess.execute(select(Enrollment.id, Enrollment.student_id)
+                                 .where(Enrollment.section_id == section.id,
+                                        Enrollment.id.in_(eids))).all())
+    valid = {a.id for a in section.assessments} & aids
+    current = {(g.enrollment_id, g.assessment_id): g for g in sess.execute(
+        select(Grade.id, Grade.enrollment_id, Grade.assessment_id, Grade.score, Grade.version)
+        .where(Grade.enrollment_id.in_(list(students)), Grade.assessment_id.in_(list(valid))))}
+
+    now = grade_log.utcnow()
+    changes, conflicts, versions, inserts = [], [], {}, []
+    for (eid, aid), (score, version) in cells.items():
+        if eid not in students or aid not in valid:
+            conflicts.append(_conflict(eid, aid, score, None, None, "gone"))
+            continue
+        cur = current.get((eid, aid))
+        if cur is None:
+            if version:
+                conflicts.append(_conflict(eid, aid, score, None, 0))
+            else:
+                inserts.append({"enrollment_id": eid, "assessment_id": aid, "score": score,
+                                "commented_at": now, "version": 1})
+            continue
+        if cur.score == score:
+            versions[(eid, aid)] = cur.version
+        elif version is not None and version != cur.version:
+            conflicts.append(_conflict(eid, aid, score, cur.score, cur.version))
+        elif sess.execute(update(Grade)
+                          .where(Grade.id == cur.id, Grade.version == cur.version)
+                          .values(score=score, commented_at=now, version=Grade.version + 1)
+                          .execution_options(synchronize_session=False)).rowcount:
+            changes.append((eid, aid, cur.score, score))
+            versions[(eid, aid)] = cur.version + 1
+        else:
+            theirs = sess.execute(select(Grade.score, Grade.version)
+                                  .where(Grade.id == cur.id)).one_or_none()
+            conflicts.append(_conflict(eid, aid, score, *(theirs or (None, 0))))
+
+    if inserts:
+        stmt = (sqlite_insert(Grade)
+                .on_conflict_do_nothing(index_elements=["enrollment_id", "assessment_id"])
+                .returning(Grade.enrollment_id, Grade.assessment_id))
+        rows = sharding.assign_ids(Grade, inserts, session=sess)
+        done = {tuple(r) for r in sess.execute(stmt, rows)}
+        for r in rows:
+            key = (r["enrollment_id"], r["assessment_id"])
+            if key in done:
+                changes.append((*key, None, r["score"]))
+                versions[key] = 1
+            else:
+                theirs = sess.execute(select(Grade.score, Grade.version)
+                                      .where(Grade.enrollment_id == key[0],
+                                             Grade.assessment_id == key[1])).one()
+                conflicts.append(_conflict(*key, r["score"], *theirs))
+
+    grade_log.record_changes(section.id, changes, actor_id=actor_id, at=now, session=sess)
+    if changes:
+        assessment_plan.recompute_totals(sess, section.id, {eid for eid, _, _, _ in changes})
+    sess.commit()
+    transcript.invalidate({students[eid] for eid, _, _, _ in changes})
+    return changes, conflicts, versions
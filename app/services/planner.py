@@ -0,0 +1,375 @@
+"""What-if schedule planning on an in-memory snapshot of one term.
+
+A ``Snapshot`` holds a term's sections and timeslots in packed ``array``
+columns plus one ``__slots__`` record of display metadata per section.  Each
+section's meetings are also folded into a week bitmask (one bit per minute,
+``weekday * 1440 + minute``), so two sections conflict exactly when their
+masks share a bit -- the same rule as ``timeslot_overlap``.
+
+``plans`` enumerates conflict-free combinations of a set of courses by
+backtracking over those masks and ranks them by the student's preferences;
+none of it touches the database.  ``commit`` then enrolls the chosen
+sections (swapping out other sections of the same courses) in one
+transaction, re-checking conflicts and capacity against live data.
+
+Snapshots are cached per term for ``PLANNER_SNAPSHOT_SECONDS`` and dropped
+when an admin edits the term's sections or timeslots; seat counts in a
+snapshot may lag by that much, which only affects ranking, not commits.
+"""
+import heapq
+import threading
+import time
+from array import array
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from ..models import Course, Enrollment, Grade, Section, Teacher, Timeslot
+from . import sharding, student_data
+
+DAY = 1440
+DAY_MASK = (1 << DAY) - 1
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+class PlanError(ValueError):
+    pass
+
+
+class SectionInfo:
+    __slots__ = ("id", "code", "course", "teacher")
+
+    def __init__(self, id, code, course, teacher):
+        self.id = id
+        self.code = code
+        self.course = course
+        self.teacher = teacher
+
+
+def _minutes(t):
+    return t.hour * 60 + t.minute
+
+
+def _hhmm(m):
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+def slot_mask(weekday, start, end):
+    """Bits for ``[start, end)`` minutes on ``weekday`` (1..7)."""
+    base = (weekday - 1) * DAY
+    return ((1 << (end - start)) - 1) << (base + start)
+
+
+class Snapshot:
+    def __init__(self, term, built_at):
+        self.term = term
+        self.built_at = built_at
+        self.section_id = array("q")
+        self.course_ix = array("i")
+        self.capacity = array("i")
+        self.enrolled = array("i")
+        self.slot_first = array("i")       # per section: first row in the slot arrays
+        self.slot_count = array("h")
+        self.slot_day = array("b")         # slot arrays, grouped by section
+        self.slot_start = array("H")       # minutes after midnight
+        self.slot_end = array("H")
+        self.slot_room = []
+        self.masks = []                    # week bitmask per section
+        self.info = []                     # SectionInfo per section
+        self.index = {}                    # section id -> index
+        self.courses = []                  # course code per course_ix
+        self.by_course = {}                # course code -> [section index]
+
+    def full(self, i):
+        return self.enrolled[i] >= self.capacity[i]
+
+    def section_dict(self, i):
+        info, lo = self.info[i], self.slot_first[i]
+        return {"id": info.id, "code": info.code, "course": info.course,
+                "teacher": info.teacher, "enrolled": self.enrolled[i],
+                "capacity": self.capacity[i],
+                "timeslots": [{"weekday": self.slot_day[k], "start": _hhmm(self.slot_start[k]),
+                               "end": _hhmm(self.slot_end[k]), "room": self.slot_room[k]}
+                              for k in range(lo, lo + self.slot_count[i])]}
+
+
+def build_snapshot(sess, term):
+    snap = Snapshot(term, time.monotonic())
+    n = student_data.enrolled_counts()
+    rows = sess.execute(
+        select(Section.id, Section.capacity, Course.code, Course.name, Teacher.name.label("teacher"),
+               func.coalesce(n.c.n, 0).label("enrolled"))
+        .join(Course, Section.course_id == Course.id)
+        .join(Teacher, Section.teacher_id == Teacher.id)
+        .outerjoin(n, n.c.section_id == Section.id)
+        .where(Section.term == term)
+        .order_by(Course.code, Section.id)).all()
+    course_ix = {}
+    for i, r in enumerate(rows):
+        ci = course_ix.setdefault(r.code, len(course_ix))
+        if ci == len(snap.courses):
+            snap.courses.append(r.code)
+        snap.section_id.append(r.id)
+        snap.course_ix.append(ci)
+        snap.capacity.append(r.capacity or 0)
+        snap.enrolled.append(r.enrolled)
+        snap.info.append(SectionInfo(r.id, r.code, r.name, r.teacher))
+        snap.index[r.id] = i
+        snap.by_course.setdefault(r.code, []).append(i)
+    slots = sess.execute(
+        select(Timeslot.section_id, Timeslot.weekday, Timeslot.start_time,
+               Timeslot.end_time, Timeslot.room)
+        .join(Section, Timeslot.section_id == Section.id)
+        .where(Section.term == term)).all()
+    slots.sort(key=lambda r: (snap.index[r.section_id], r.weekday, r.start_time))
+    k = 0
+    for i in range(len(rows)):
+        snap.slot_first.append(k)
+        mask = 0
+        while k < len(slots) and snap.index[slots[k].section_id] == i:
+            r = slots[k]
+            start, end = _minutes(r.start_time), _minutes(r.end_time)
+            snap.slot_day.append(r.weekday)
+            snap.slot_start.append(start)
+            snap.slot_end.append(end)
+            snap.slot_room.append(r.room)
+            mask |= slot_mask(r.weekday, start, end)
+            k += 1
+        snap.slot_count.append(k - snap.slot_first[i])
+        snap.masks.append(mask)
+    return snap
+
+
+def snapshot(term):
+    ttl = current_app.config["PLANNER_SNAPSHOT_SECONDS"]
+    with _snapshots_lock:
+        snap = _snapshots.get(term)
+    if snap is not None and time.monotonic() - snap.built_at < ttl:
+        return snap
+    snap = build_snapshot(sharding.session_for(term), term)
+    with _snapshots_lock:
+        _snapshots[term] = snap
+    return snap
+
+
+def invalidate(term=None):
+    with _snapshots_lock:
+        if term is None:
+            _snapshots.clear()
+        else:
+            _snapshots.pop(term, None)
+
+
+# ---------- enumeration and ranking ----------
+class Preferences:
+    __slots__ = ("no_before", "no_after", "compact", "fewer_days", "avoid_days", "include_full")
+
+    def __init__(self, no_before=None, no_after=None, compact=False, fewer_days=False,
+                 avoid_days=(), include_full=False):
+        self.no_before = no_before          # minutes; classes starting earlier cost
+        self.no_after = no_after            # minutes; classes ending later cost
+        self.compact = compact              # idle minutes between classes cost
+        self.fewer_days = fewer_days        # each day on campus costs
+        self.avoid_days = frozenset(avoid_days)
+        self.include_full = include_full
+
+    @classmethod
+    def from_args(cls, args):
+        def hhmm(v):
+            if not v:
+                return None
+            try:
+                h, m = v.split(":")
+                return int(h) * 60 + int(m)
+            except ValueError:
+                raise PlanError("Time format must be HH:MM")
+        days = [int(d) for d in (args.get("avoid_days") or "").split(",") if d.strip().isdigit()]
+        flag = lambda k: (args.get(k) or "") in ("1", "true", "on")
+        return cls(hhmm(args.get("no_before")), hhmm(args.get("no_after")), flag("compact"),
+                   flag("fewer_days"), days, flag("include_full"))
+
+
+def score(mask, prefs):
+    """``(penalty, stats)`` for a combined week mask; lower penalty is better."""
+    days = early = late = gaps = avoided = 0
+    for d in range(7):
+        bits = (mask >> (d * DAY)) & DAY_MASK
+        if not bits:
+            continue
+        days += 1
+        first = (bits & -bits).bit_length() - 1
+        last = bits.bit_length()                  # end minute (exclusive)
+        gaps += (last - first) - bits.bit_count()
+        if prefs.no_before is not None and first < prefs.no_before:
+            early += prefs.no_before - first
+        if prefs.no_after is not None and last > prefs.no_after:
+            late += last - prefs.no_after
+        if d + 1 in prefs.avoid_days:
+            avoided += 1
+    penalty = early + late + avoided * 600
+    if prefs.compact:
+        penalty += gaps
+    if prefs.fewer_days:
+        penalty += days * 120
+    return penalty, {"days": days, "gap_minutes": gaps, "early_minutes": early,
+                     "late_minutes": late, "avoided_days": avoided}
+
+
+def plans(snap, codes, prefs, base_mask=0, limit=20):
+    """Best ``limit`` conflict-free picks of one section per course code.
+
+    ``base_mask`` holds the student's other commitments that term.  At most
+    ``PLANNER_MAX_COMBINATIONS`` combinations are scored and at most
+    ``PLANNER_MAX_STEPS`` section/mask tests are made; returns
+    ``(plans, combinations seen, truncated)``.
+    """
+    cfg = current_app.config
+    if len(codes) > cfg["PLANNER_MAX_COURSES"]:
+        raise PlanError(f"Plan at most {cfg['PLANNER_MAX_COURSES']} courses at once")
+    cap, budget = cfg["PLANNER_MAX_COMBINATIONS"], cfg["PLANNER_MAX_STEPS"]
+    missing = [c for c in codes if c not in snap.by_course]
+    if missing:
+        raise PlanError(f"Not offered in {snap.term}: {', '.join(missing)}")
+    groups = []
+    for code in codes:
+        cands = [i for i in snap.by_course[code]
+                 if prefs.include_full or not snap.full(i)]
+        if not cands:
+            return [], 0, False
+        groups.append(cands)
+    groups.sort(key=len)                          # most constrained first
+
+    best, seen, counter, steps = [], 0, 0, 0
+    pick = []
+    masks = snap.masks
+
+    def viable(depth, mask):
+        # forward check: every remaining course still has a section that fits
+        nonlocal steps
+        for group in groups[depth:]:
+            steps += len(group)
+            if all(mask & masks[i] for i in group):
+                return False
+        return True
+
+    def walk(depth, mask):
+        nonlocal seen, counter, steps
+        if seen >= cap or steps >= budget:
+            return
+        if depth == len(groups):
+            seen += 1
+            penalty, stats = score(mask, prefs)
+            counter += 1
+            item = (-penalty, -counter, tuple(pick), stats)
+            if len(best) < limit:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+            return
+        for i in groups[depth]:
+            steps += 1
+            m = masks[i]
+            if mask & m or not viable(depth + 1, mask | m):
+                continue
+            pick.append(i)
+            walk(depth + 1, mask | m)
+            pick.pop()
+            if seen >= cap or steps >= budget:
+                return
+
+    walk(0, base_mask)
+    out = []
+    for neg_penalty, _, picked, stats in sorted(best, reverse=True):
+        out.append({"penalty": -neg_penalty, **stats,
+                    "sections": [snap.section_dict(i) for i in picked]})
+    return out, seen, seen >= cap or steps >= budget
+
+
+def base_mask(sess, snap, student_id, exclude_codes):
+    """Mask of the student's current sections that term, except ``exclude_codes``."""
+    mask = 0
+    ids = sess.execute(select(Enrollment.section_id).join(Section)
+                       .where(Enrollment.student_id == student_id,
+                              Section.term == snap.term)).scalars()
+    for sid in ids:
+        i = snap.index.get(sid)
+        if i is not None and snap.info[i].code not in exclude_codes:
+            mask |= snap.masks[i]
+    return mask
+
+
+def section_masks(sess, section_ids):
+    """``{section_id: week mask}`` from live timeslots (sections without any are left out)."""
+    masks = {}
+    for r in sess.execute(select(Timeslot.section_id, Timeslot.weekday,
+                                 Timeslot.start_time, Timeslot.end_time)
+                          .where(Timeslot.section_id.in_(section_ids))):
+        masks[r.section_id] = masks.get(r.section_id, 0) | slot_mask(
+            r.weekday, _minutes(r.start_time), _minutes(r.end_time))
+    return masks
+
+
+# ---------- committing a plan ----------
+def commit(student_id, term, section_ids):
+    """Enroll in ``section_ids`` as one transaction; returns (added, dropped).
+
+    Other sections of the same courses the student holds that term are
+    dropped in the same transaction.  Conflicts are re-checked against live
+    timeslots, and capacity is checked after the inserts, inside the write
+    transaction, so concurrent commits cannot overfill a section.
+    """
+    sess = sharding.session_for(term)
+    section_ids = list(dict.fromkeys(int(s) for s in section_ids))
+    if not section_ids:
+        raise PlanError("Empty plan")
+    secs = sess.execute(select(Section.id, Section.course_id, Section.capacity)
+                        .where(Section.id.in_(section_ids), Section.term == term)).all()
+    if len(secs) != len(section_ids):
+        raise PlanError("Some classes do not exist in this term")
+    courses = [s.course_id for s in secs]
+    if len(set(courses)) != len(courses):
+        raise PlanError("Only one class per course")
+
+    mine = sess.execute(select(Enrollment.id, Enrollment.section_id, Section.course_id)
+                        .join(Section).where(Enrollment.student_id == student_id,
+                                             Section.term == term)).all()
+    keep = {m.section_id for m in mine}
+    swap = [m for m in mine if m.course_id in set(courses) and m.section_id not in section_ids]
+    final = (keep - {m.section_id for m in swap}) | set(section_ids)
+    added = [sid for sid in section_ids if sid not in keep]
+
+    mask_of = section_masks(sess, final)
+    week = 0
+    for sid in final:
+        m = mask_of.get(sid, 0)
+        if week & m:
+            raise PlanError("The plan has a time conflict with your current classes")
+        week |= m
+
+    try:
+        if swap:
+            sess.execute(delete(Grade).where(Grade.enrollment_id.in_([m.id for m in swap])))
+            sess.execute(delete(Enrollment).where(Enrollment.id.in_([m.id for m in swap])))
+        if added:
+            sess.execute(insert(Enrollment), sharding.assign_ids(Enrollment, [
+                {"student_id": student_id, "section_id": sid, "status": "enrolled"}
+                for sid in added], session=sess))
+            counts = dict(sess.execute(
+                select(Enrollment.section_id, func.count(Enrollment.id))
+                .where(Enrollment.section_id.in_(added))
+                .group_by(Enrollment.section_id)).all())
+            cap = {s.id: s.capacity for s in secs}
+            full = [sid for sid in added if counts.get(sid, 0) > (cap[sid] or 0)]
+            if full:
+                raise PlanError("Full")
+        sess.commit()
+    except IntegrityError:
+        sess.rollback()
+        raise PlanError("Already enrolled")
+    except Exception:
+        sess.rollback()
+        raise
+    return added, [m.section_id for m in swap]
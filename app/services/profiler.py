@@ -0,0 +1,339 @@
+"""On-demand request profiling: sampled stacks plus the SQL a request ran.
+
+A request is profiled when it carries a valid signed ``PROFILE_HEADER``
+(``flask profiles token``), while an admin has profiling switched on, or at
+random with probability ``PROFILE_SAMPLE_RATE``.  One daemon thread samples
+the stacks of every request being profiled each ``PROFILE_INTERVAL_MS``
+through ``sys._current_frames``; each sample is weighted by the wall time
+since the previous one and by the CPU time the request's thread used in
+between (its per-thread CPU clock), so one run yields both a wall-clock and
+a CPU profile.  SQL statements are timed with engine cursor events.
+
+Each profile is one JSON file in ``PROFILE_DIR``; only the newest
+``PROFILE_MAX_FILES`` are kept.  Stacks are stored in the collapsed
+("folded") format that flamegraph.pl and speedscope read directly.
+Requests profiled this way run on the Flask side only (not the async
+handlers of ``app.asgi``).
+"""
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from flask import current_app, g, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+MAX_DEPTH = 128
+MAX_STATEMENT_CHARS = 2000
+
+_current = contextvars.ContextVar("profile", default=None)
+_listening = False
+_root = str(Path(__file__).resolve().parents[2]) + os.sep
+
+
+def _label(code):
+    path = code.co_filename
+    cut = path.rfind("site-packages")
+    if cut >= 0:
+        path = path[cut + 14:]
+    elif path.startswith(_root):
+        path = path[len(_root):]
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _cpu_clock(ident):
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):     # not available on this platform
+        return None
+
+
+class Profile:
+    def __init__(self, trigger, max_statements):
+        self.id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.trigger = trigger
+        self.ident = threading.get_ident()
+        self.clock = _cpu_clock(self.ident)
+        self.lock = threading.Lock()
+        self.done = False
+        self.wall = {}                    # folded stack -> microseconds
+        self.cpu = {}
+        self.sql = []
+        self.sql_dropped = 0
+        self.max_statements = max_statements
+        self.status = None
+        self.started = time.perf_counter()
+        self.cpu_started = time.thread_time()
+        self.last_wall = self.started
+        self.last_cpu = self._cpu_now()
+
+    def _cpu_now(self):
+        return time.clock_gettime(self.clock) if self.clock is not None else 0.0
+
+    def sample(self, frame, now):
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            stack.append(_label(frame.f_code))
+            frame = frame.f_back
+        key = ";".join(reversed(stack))
+        with self.lock:
+            if self.done:
+                return
+            cpu = self._cpu_now()
+            self.wall[key] = self.wall.get(key, 0) + int((now - self.last_wall) * 1e6)
+            if self.clock is not None:
+                self.cpu[key] = self.cpu.get(key, 0) + int((cpu - self.last_cpu) * 1e6)
+            self.last_wall, self.last_cpu = now, cpu
+
+    def statement(self, text, seconds, many):
+        if len(self.sql) >= self.max_statements:
+            self.sql_dropped += 1
+            return
+        self.sql.append({"sql": text[:MAX_STATEMENT_CHARS], "ms": round(seconds * 1000, 3),
+                         "executemany": many})
+
+    def finish(self):
+        with self.lock:
+            self.done = True
+        self.wall_ms = round((time.perf_counter() - self.started) * 1000, 3)
+        self.cpu_ms = round((time.thread_time() - self.cpu_started) * 1000, 3)
+
+
+class Sampler:
+    """One thread sampling every registered request thread."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = {}                 # thread ident -> Profile
+        self._thread = None
+
+    def add(self, prof):
+        with self._lock:
+            self._active[prof.ident] = prof
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler",
+                                                daemon=True)
+                self._thread.start()
+
+    def remove(self, prof):
+        with self._lock:
+            self._active.pop(prof.ident, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                profs = list(self._active.values())
+                if not profs:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for p in profs:
+                frame = frames.get(p.ident)
+                if frame is not None:
+                    p.sample(frame, now)
+            del frames
+            time.sleep(self.interval)
+
+
+sampler = Sampler()
+
+
+# ---------- triggers ----------
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt="profile")
+
+
+def make_token(by):
+    """Value for ``PROFILE_HEADER`` that profiles a request."""
+    return _serializer().dumps({"by": by})
+
+
+def _token_ok(token):
+    try:
+        _serializer().loads(token, max_age=current_app.config["PROFILE_TOKEN_MAX_AGE"])
+        return True
+    except BadSignature:
+        return False
+
+
+_toggle = {"checked": 0.0, "until": 0.0}
+
+
+def _toggle_path():
+    return profile_dir() / "enabled-until"
+
+
+def enabled_until():
+    """Epoch seconds the admin toggle stays on for (0 when off); re-read each second."""
+    now = time.time()
+    if now - _toggle["checked"] > 1:
+        try:
+            _toggle["until"] = float(_toggle_path().read_text())
+        except (OSError, ValueError):
+            _toggle["until"] = 0.0
+        _toggle["checked"] = now
+    return _toggle["until"]
+
+
+def set_enabled(minutes):
+    """Profile every request for ``minutes`` (0 switches the toggle off).
+
+    Kept in a file so every worker process sees it.
+    """
+    path = _toggle_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(str(time.time() + minutes * 60 if minutes > 0 else 0))
+    _toggle["checked"] = 0.0
+
+
+def _trigger():
+    cfg = current_app.config
+    token = request.headers.get(cfg["PROFILE_HEADER"])
+    if token:
+        return "header" if _token_ok(token) else None
+    if request.blueprint == "admin" and (request.endpoint or "").startswith("admin.profile"):
+        return None
+    if enabled_until() > time.time():
+        return "toggle"
+    rate = cfg["PROFILE_SAMPLE_RATE"]
+    if rate and random.random() < rate:
+        return "sample"
+    return None
+
+
+# ---------- request hooks ----------
+def _start():
+    if request.endpoint == "static":
+        return
+    trigger = _trigger()
+    if trigger is None:
+        return
+    prof = Profile(trigger, current_app.config["PROFILE_MAX_STATEMENTS"])
+    g.profile = prof
+    g.profile_token = _current.set(prof)
+    sampler.add(prof)
+
+
+def _after(response):
+    prof = g.get("profile")
+    if prof is not None:
+        prof.status = response.status_code
+        response.headers["X-Profile-Id"] = prof.id
+    return response
+
+
+def _stop(exc=None):
+    prof = g.pop("profile", None)
+    if prof is None:
+        return
+    sampler.remove(prof)
+    _current.reset(g.pop("profile_token"))
+    prof.finish()
+    try:
+        save(prof, exc)
+    except OSError as e:
+        current_app.logger.warning("could not write profile %s: %s", prof.id, e)
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_t0", []).append(time.perf_counter())
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    prof = _current.get()
+    if prof is not None and conn.info.get("profile_t0"):
+        prof.statement(statement, time.perf_counter() - conn.info["profile_t0"].pop(),
+                       executemany)
+
+
+# ---------- storage ----------
+def profile_dir():
+    return Path(current_app.config["PROFILE_DIR"])
+
+
+def save(prof, exc=None):
+    d = profile_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    doc = {"id": prof.id, "trigger": prof.trigger, "method": request.method,
+           "path": request.full_path.rstrip("?"), "endpoint": request.endpoint,
+           "status": prof.status if exc is None else 500,
+           "error": repr(exc) if exc is not None else None,
+           "at": datetime.utcnow().isoformat(timespec="seconds"),
+           "wall_ms": prof.wall_ms, "cpu_ms": prof.cpu_ms,
+           "sql_ms": round(sum(s["ms"] for s in prof.sql), 3),
+           "sql_count": len(prof.sql) + prof.sql_dropped, "sql_dropped": prof.sql_dropped,
+           "interval_ms": sampler.interval * 1000,
+           "wall": prof.wall, "cpu": prof.cpu if prof.clock is not None else None,
+           "sql": prof.sql}
+    tmp = d / f".{prof.id}.tmp"
+    tmp.write_text(json.dumps(doc))
+    os.replace(tmp, d / f"{prof.id}.json")
+    _prune(d)
+
+
+def _prune(d):
+    files = sorted(d.glob("*.json"))
+    for f in files[:max(len(files) - current_app.config["PROFILE_MAX_FILES"], 0)]:
+        f.unlink(missing_ok=True)
+
+
+def _path(profile_id):
+    if not profile_id or "/" in profile_id or profile_id.startswith("."):
+        raise FileNotFoundError(profile_id)
+    return profile_dir() / f"{profile_id}.json"
+
+
+def load(profile_id):
+    return json.loads(_path(profile_id).read_text())
+
+
+def summaries():
+    """Newest first, without the stacks and statements."""
+    out = []
+    for f in sorted(profile_dir().glob("*.json"), reverse=True):
+        try:
+            doc = json.loads(f.read_text())
+        except (OSError, ValueError):
+            continue
+        doc["has_cpu"] = doc.pop("cpu", None) is not None
+        doc.pop("wall", None)
+        doc.pop("sql", None)
+        out.append(doc)
+    return out
+
+
+def folded(doc, kind):
+    """Collapsed-stack text (``frame;frame;frame weight``), weights in microseconds."""
+    stacks = doc.get(kind) or {}
+    return "".join(f"{stack} {w}\n" for stack, w in sorted(stacks.items()) if w > 0)
+
+
+def sql_text(doc):
+    lines = [f"-- {s['ms']} ms{' (executemany)' if s['executemany'] else ''}\n{s['sql']};\n"
+             for s in doc["sql"]]
+    if doc.get("sql_dropped"):
+        lines.append(f"-- {doc['sql_dropped']} more statements not recorded\n")
+    return "\n".join(lines)
+
+
+def init_app(app):
+    global _listening
+    sampler.interval = app.config["PROFILE_INTERVAL_MS"] / 1000.0
+    app.before_request(_start)
+    app.after_request(_after)
+    app.teardown_request(_stop)
+    if not _listening:
+        event.listen(Engine, "before_cursor_execute", _before_cursor)
+        event.listen(Engine, "after_cursor_execute", _after_cursor)
+        _listening = True
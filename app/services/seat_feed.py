@@ -0,0 +1,137 @@
+"""In-process pub/sub for live seat counts.
+
+Writers call ``publish_sections`` after committing an enroll/drop/capacity
+change.  The feed keeps the last known ``(enrolled, capacity)`` per section,
+drops no-op updates, and coalesces the rest: each flush window (``interval``)
+sends at most one value per section, encoded once per term and handed to
+every subscriber of that term with one callback per event loop, so thousands
+of idle SSE connections cost a queue each and nothing else.
+"""
+import asyncio
+import json
+import threading
+
+from ..extensions import db
+from . import student_data
+
+
+class Subscriber:
+    __slots__ = ("term", "loop", "queue")
+
+    def __init__(self, term, loop, maxsize):
+        self.term = term
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, payload):
+        # runs on self.loop; a slow consumer gets a None (= resync) marker
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            payload = None
+        self.queue.put_nowait(payload)
+
+
+class SeatFeed:
+    def __init__(self, interval=0.25, queue_size=32):
+        self.interval = interval
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._last = {}      # term -> {section_id: [enrolled, capacity]}
+        self._pending = {}   # term -> {section_id: [enrolled, capacity] | None}
+        self._subs = {}      # term -> set[Subscriber]
+        self._timer = None
+
+    def active(self):
+        return bool(self._subs)
+
+    def subscribers(self, term):
+        return len(self._subs.get(term, ()))
+
+    def snapshot(self, term):
+        with self._lock:
+            return dict(self._last.get(term, {}))
+
+    def subscribe(self, term, loop=None):
+        sub = Subscriber(term, loop or asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subs.setdefault(term, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.term)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.term]
+
+    def remember(self, term, rows):
+        """Seed last-known values from a fresh read without notifying anyone."""
+        with self._lock:
+            last = self._last.setdefault(term, {})
+            for r in rows:
+                last[r.id] = [r.enrolled, r.capacity]
+
+    def publish(self, term, section_id, enrolled=None, capacity=None):
+        """Record a section's seats; ``enrolled=None`` means it was removed."""
+        val = None if enrolled is None else [enrolled, capacity]
+        with self._lock:
+            last = self._last.setdefault(term, {})
+            if val is None:
+                if last.pop(section_id, None) is None:
+                    return
+            elif last.get(section_id) == val:
+                return
+            else:
+                last[section_id] = val
+            if term not in self._subs:
+                return
+            self._pending.setdefault(term, {})[section_id] = val
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+            targets = {t: list(self._subs.get(t, ())) for t in pending}
+        by_loop = {}
+        for term, seats in pending.items():
+            payload = json.dumps({"term": term, "seats": seats}, separators=(",", ":"))
+            for sub in targets[term]:
+                by_loop.setdefault(sub.loop, []).append((sub, payload))
+        for loop, items in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, items)
+            except RuntimeError:          # loop closed: drop its subscribers
+                for sub, _ in items:
+                    self.unsubscribe(sub)
+
+
+def _deliver(items):
+    for sub, payload in items:
+        sub.put(payload)
+
+
+feed = SeatFeed()
+
+
+def init_app(app):
+    feed.interval = app.config["SEAT_FEED_INTERVAL_MS"] / 1000.0
+    feed.queue_size = app.config["SEAT_FEED_QUEUE_SIZE"]
+
+
+def publish_sections(section_ids, session=None):
+    """Re-read and publish seat counts for sections changed by a commit."""
+    if not feed.active() or not section_ids:
+        return
+    rows = (session or db.session).execute(student_data.section_seats_stmt(section_ids)).all()
+    for r in rows:
+        feed.publish(r.term, r.id, r.enrolled, r.capacity)
+
+
+def publish_removed(term, section_id):
+    feed.publish(term, section_id)
@@ -0,0 +1,307 @@
+"""Term-keyed sharding of section data across SQLite files.
+
+``SHARDS`` maps shard names to SQLite URIs.  A term's section, timeslot,
+enrollment, assessment, grade and grade_event rows live in the shard the
+global ``term_shard`` directory assigns it to; unassigned terms stay in the
+main database (the ``default`` shard).  Users, students, teachers, courses
+and the directory stay global.  Every shard connection ATTACHes the main
+database, so joins from sections to courses and teachers keep working.
+
+Ids of sharded rows come from a global block allocator, so they are unique
+across shards and survive moves, and ``locate`` can find a row by id on any
+shard.  With ``SHARDS`` empty every helper returns ``db.session``.
+"""
+import heapq
+import threading
+from contextlib import contextmanager
+from itertools import islice
+
+from flask import current_app, g
+from sqlalchemy import create_engine, delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from ..extensions import db
+from ..models import (Assessment, Enrollment, Grade, GradeEvent, Section, ShardIdBlock,
+                      TermShard, Timeslot)
+from .term_rows import move_rows
+
+DEFAULT = "default"
+SHARDED_MODELS = (Section, Timeslot, Enrollment, Assessment, Grade, GradeEvent)
+
+_engines = {}
+_engines_lock = threading.Lock()
+_listening = False
+
+
+def enabled():
+    return bool(current_app.config["SHARDS"])
+
+
+def shard_names():
+    return [DEFAULT] + list(current_app.config["SHARDS"])
+
+
+def engine(name):
+    if name == DEFAULT:
+        return db.engine
+    uri = current_app.config["SHARDS"][name]
+    with _engines_lock:
+        eng = _engines.get(uri)
+        if eng is None:
+            eng = create_engine(uri)
+            directory = db.engine.url.database
+
+            @event.listens_for(eng, "connect")
+            def _attach(dbapi_conn, _):
+                dbapi_conn.execute("ATTACH DATABASE ? AS directory", (directory,))
+
+            db.metadata.create_all(eng, tables=[m.__table__ for m in SHARDED_MODELS])
+            _engines[uri] = eng
+        return eng
+
+
+def session(name):
+    if name == DEFAULT:
+        return db.session
+    sessions = g.setdefault("shard_sessions", {})
+    if name not in sessions:
+        eng = engine(name)
+        sessions[name] = Session(bind=db.engine, binds={m: eng for m in SHARDED_MODELS})
+    return sessions[name]
+
+
+def close_shard_sessions(exc=None):
+    for s in g.pop("shard_sessions", {}).values():
+        s.close()
+
+
+def shard_of(term):
+    if not term or not enabled():
+        return DEFAULT
+    name = db.session.execute(select(TermShard.shard)
+                              .where(TermShard.term == term)).scalar()
+    return name or DEFAULT
+
+
+def session_for(term):
+    return session(shard_of(term))
+
+
+def all_sessions():
+    if not enabled():
+        return [db.session]
+    return [session(n) for n in shard_names()]
+
+
+def locate(model, ident):
+    """``(session, obj)`` for a sharded row by id; obj is None if not found."""
+    for s in all_sessions():
+        obj = s.get(model, ident)
+        if obj is not None:
+            return s, obj
+    return db.session, None
+
+
+def scatter(fn):
+    """Concatenate ``fn(session)`` over every shard."""
+    out = []
+    for s in all_sessions():
+        out.extend(fn(s))
+    return out
+
+
+def scatter_page(build, key, reverse=False, offset=0, limit=10, sessions=None):
+    """Cross-shard pagination: ``build(session)`` returns an ordered Query.
+
+    Each shard returns at most ``offset + limit`` rows; they are merged by
+    ``key`` and sliced, so the result matches a single-database query.
+    """
+    sessions = sessions or all_sessions()
+    if len(sessions) == 1:
+        q = build(sessions[0])
+        return q.order_by(None).count(), q.offset(offset).limit(limit).all()
+    total, parts = 0, []
+    for s in sessions:
+        q = build(s)
+        total += q.order_by(None).count()
+        parts.append(q.limit(offset + limit).all())
+    merged = heapq.merge(*parts, key=key, reverse=reverse)
+    return total, list(islice(merged, offset, offset + limit))
+
+
+# ---------- global ids ----------
+class IdAllocator:
+    """Hands out ids from blocks reserved in the global ``shard_id_block`` table."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._free = {}      # table -> (next, end)
+
+    def take(self, table, n=1, conn=None):
+        """``n`` fresh ids; ``conn`` is a main-database connection already
+        holding the write lock, used instead of a second (blocked) one."""
+        with self._lock:
+            if conn is not None:
+                # exact-size block inside the caller's transaction, so a
+                # rollback returns it along with the rows that used it
+                nxt = self._reserve(table, n, conn)
+                return list(range(nxt, nxt + n))
+            nxt, end = self._free.get(table, (0, 0))
+            if end - nxt < n:
+                size = max(n, current_app.config["SHARD_ID_BLOCK"])
+                nxt = self._reserve(table, size)
+                end = nxt + size
+            self._free[table] = (nxt + n, end)
+            return list(range(nxt, nxt + n))
+
+    def _reserve(self, table, size, conn=None):
+        blk = ShardIdBlock.__table__
+        for _ in range(2):
+            with _begin(conn) as c:
+                res = c.execute(update(blk).where(blk.c.name == table)
+                                .values(next_id=blk.c.next_id + size))
+                if res.rowcount:
+                    nxt = c.execute(select(blk.c.next_id).where(blk.c.name == table)).scalar()
+                    return nxt - size
+            self._seed(table, conn)
+        raise RuntimeError(f"cannot reserve ids for {table}")
+
+    def _seed(self, table, conn=None):
+        # first use: start above every id already present on any shard
+        t = db.metadata.tables[table]
+        floor = 1
+        for name in shard_names():
+            with _begin(conn if name == DEFAULT else None, engine(name)) as c:
+                floor = max(floor, 1 + (c.execute(select(func.max(t.c.id))).scalar() or 0))
+        blk = ShardIdBlock.__table__
+        with _begin(conn) as c:
+            c.execute(insert(blk).prefix_with("OR IGNORE").values(name=table, next_id=floor))
+
+
+@contextmanager
+def _begin(conn, eng=None):
+    if conn is not None:
+        yield conn
+    else:
+        with (eng or db.engine).begin() as c:
+            yield c
+
+
+allocator = IdAllocator()
+
+
+def assign_ids(model, rows, session=None):
+    """Fill ``id`` for Core bulk inserts of a sharded model (no-op if disabled).
+
+    Pass the ``session`` that will run the insert, so a write lock it already
+    holds on the main database is reused rather than waited on.
+    """
+    if enabled() and rows:
+        conn = _locked_main_conn(session) if session is not None else None
+        for row, i in zip(rows, allocator.take(model.__tablename__, len(rows), conn)):
+            row["id"] = i
+    return rows
+
+
+def _locked_main_conn(session):
+    """The session's main-database connection if it holds the write lock."""
+    conn = session.connection(bind_arguments={"bind": db.engine})
+    return conn if conn.connection.dbapi_connection.in_transaction else None
+
+
+def _assign_ids(session, flush_context, instances):
+    pending = {}
+    for obj in session.new:
+        if isinstance(obj, SHARDED_MODELS) and obj.id is None:
+            pending.setdefault(obj.__tablename__, []).append(obj)
+    if not pending:
+        return
+    conn = _locked_main_conn(session)
+    for table, objs in pending.items():
+        for obj, i in zip(objs, allocator.take(table, len(objs), conn)):
+            obj.id = i
+
+
+def init_app(app):
+    global _listening
+    app.teardown_appcontext(close_shard_sessions)
+    if app.config["SHARDS"] and not _listening:
+        event.listen(Session, "before_flush", _assign_ids)
+        _listening = True
+
+
+# ---------- moves ----------
+def _set_shard(conn, term, name):
+    conn.execute(delete(TermShard.__table__).where(TermShard.__table__.c.term == term))
+    if name != DEFAULT:
+        conn.execute(insert(TermShard.__table__).values(term=term, shard=name))
+
+
+def assign(term, name):
+    """Point an empty term at a shard (before any sections are created)."""
+    if name not in shard_names():
+        raise ValueError(f"unknown shard {name}")
+    if scatter(lambda s: s.query(Section.id).filter(Section.term == term).limit(1).all()):
+        raise ValueError(f"term {term} already has sections; use move instead")
+    with db.engine.begin() as conn:
+        _set_shard(conn, term, name)
+
+
+def move_term(term, dest):
+    """Move a term's rows from their shard to ``dest`` and repoint it.
+
+    Ids are global, so rows keep them; OR REPLACE makes a re-run after a
+    partial failure safe.  Rows are deleted from the source before they are
+    inserted (see ``move_rows``), so writes racing the move either land
+    before it and move along, or wait for it.
+    """
+    if dest not in shard_names():
+        raise ValueError(f"unknown shard {dest}")
+    src = shard_of(term)
+    if src == dest:
+        raise ValueError(f"term {term} is already on {dest}")
+    db.session.commit()
+    with engine(dest).begin() as dconn, engine(src).begin() as sconn:
+        counts = move_rows(sconn, dconn, term, SHARDED_MODELS, "OR REPLACE")
+        # the directory lives in the main database; reuse its open connection
+        if src == DEFAULT:
+            _set_shard(sconn, term, dest)
+        elif dest == DEFAULT:
+            _set_shard(dconn, term, dest)
+        else:
+            with db.engine.begin() as conn:
+                _set_shard(conn, term, dest)
+    return counts
+
+
+def term_loads():
+    """``[(term, shard, sections, enrollments)]`` for every hot term."""
+    out = []
+    for name in shard_names():
+        with engine(name).connect() as conn:
+            rows = conn.execute(
+                select(Section.term, func.count(func.distinct(Section.id)),
+                       func.count(Enrollment.id))
+                .outerjoin(Enrollment, Enrollment.section_id == Section.id)
+                .group_by(Section.term)).all()
+        out += [(term, name, secs, ens) for term, secs, ens in rows]
+    return out
+
+
+def plan_rebalance(include_default=True):
+    """Greedy largest-first placement; returns the moves ``[(term, src, dest, weight)]``.
+
+    A term weighs its sections plus enrollments.
+    """
+    names = [n for n in shard_names() if include_default or n != DEFAULT]
+    load = dict.fromkeys(names, 0)
+    moves = []
+    loads = [(term, cur, secs + ens) for term, cur, secs, ens in term_loads()]
+    for term, cur, w in sorted(loads, key=lambda t: -t[2]):
+        if cur not in load:
+            continue
+        dest = min(names, key=lambda n: (load[n], n != cur))
+        load[dest] += w
+        if dest != cur:
+            moves.append((term, cur, dest, w))
+    return moves
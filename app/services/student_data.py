@@ -0,0 +1,164 @@
+"""Query builders and JSON shaping for the student read API.
+
+Only ``select()`` statements and pure functions live here, so the same code
+runs on ``db.session`` (WSGI) and on an ``AsyncSession`` (``app.asgi``).
+"""
+from sqlalchemy import and_, func, or_, select
+
+from ..models import Assessment, Course, Enrollment, Grade, Section, Teacher, Timeslot
+
+
+def _int(v, default):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return default
+
+
+def catalog_args(args):
+    return {
+        "term": (args.get("term") or "").strip(),
+        "q": (args.get("q") or "").strip(),
+        "sort": args.get("sort") or "course",
+        "order": args.get("order") or "asc",
+        "page": max(_int(args.get("page"), 1), 1),
+        "per_page": min(max(_int(args.get("per_page"), 10), 1), 100),
+    }
+
+
+def enrolled_counts():
+    return (select(Enrollment.section_id, func.count(Enrollment.id).label("n"))
+            .group_by(Enrollment.section_id).subquery())
+
+
+def catalog_stmts(a, window=False):
+    """(count statement, page statement) for the filtered catalog.
+
+    ``window=True`` returns every row up to the end of the page instead, for
+    merging pages across shards (see ``catalog_sort_key``).
+    """
+    n = enrolled_counts()
+    q = (select(Section.id, Section.term, Section.capacity,
+                Course.code, Course.name.label("course"), Teacher.name.label("teacher"),
+                func.coalesce(n.c.n, 0).label("enrolled"))
+         .join(Course, Section.course_id == Course.id)
+         .join(Teacher, Section.teacher_id == Teacher.id)
+         .outerjoin(n, n.c.section_id == Section.id))
+    if a["term"]:
+        q = q.where(Section.term == a["term"])
+    if a["q"]:
+        like = f"%{a['q']}%"
+        q = q.where(or_(Course.name.ilike(like), Course.code.ilike(like), Teacher.name.ilike(like)))
+    total = select(func.count()).select_from(q.subquery())
+    col = {"course": Course.name, "teacher": Teacher.name, "cap": Section.capacity}.get(a["sort"], Course.name)
+    q = q.order_by(col.desc() if a["order"] == "desc" else col.asc(), Section.id)
+    if window:
+        return total, q.limit(a["page"] * a["per_page"])
+    return total, q.offset((a["page"] - 1) * a["per_page"]).limit(a["per_page"])
+
+
+def catalog_sort_key(a):
+    col = {"course": "course", "teacher": "teacher", "cap": "capacity"}.get(a["sort"], "course")
+    return lambda r: getattr(r, col)
+
+
+def slots_stmt(section_ids):
+    return (select(Timeslot.section_id, Timeslot.weekday, Timeslot.start_time,
+                   Timeslot.end_time, Timeslot.room)
+            .where(Timeslot.section_id.in_(section_ids))
+            .order_by(Timeslot.weekday, Timeslot.start_time))
+
+
+def my_sections_stmt(student_id, section_ids):
+    return (select(Enrollment.section_id, Enrollment.id)
+            .where(Enrollment.student_id == student_id, Enrollment.section_id.in_(section_ids)))
+
+
+def _slot(r):
+    return {"weekday": r.weekday, "start": r.start_time.strftime("%H:%M"),
+            "end": r.end_time.strftime("%H:%M"), "room": r.room}
+
+
+def shape_catalog(a, total, rows, slot_rows, mine):
+    slots = {}
+    for r in slot_rows:
+        slots.setdefault(r.section_id, []).append(_slot(r))
+    mine = dict(mine)
+    return {
+        "term": a["term"], "page": a["page"], "per_page": a["per_page"], "total": total,
+        "pages": (total + a["per_page"] - 1) // a["per_page"],
+        "sections": [{
+            "id": r.id, "term": r.term, "code": r.code, "course": r.course,
+            "teacher": r.teacher, "capacity": r.capacity, "enrolled": r.enrolled,
+            "timeslots": slots.get(r.id, []), "enrollment_id": mine.get(r.id),
+        } for r in rows],
+    }
+
+
+def seats_stmt(term):
+    n = enrolled_counts()
+    return (select(Section.id, Section.capacity, func.coalesce(n.c.n, 0).label("enrolled"))
+            .outerjoin(n, n.c.section_id == Section.id)
+            .where(Section.term == term))
+
+
+def section_seats_stmt(section_ids):
+    n = enrolled_counts()
+    return (select(Section.id, Section.term, Section.capacity,
+                   func.coalesce(n.c.n, 0).label("enrolled"))
+            .outerjoin(n, n.c.section_id == Section.id)
+            .where(Section.id.in_(section_ids)))
+
+
+def shape_seats(term, rows):
+    return {"term": term, "seats": {r.id: [r.enrolled, r.capacity] for r in rows}}
+
+
+def timetable_stmt(student_id, term):
+    return (select(Timeslot.weekday, Timeslot.start_time, Timeslot.end_time, Timeslot.room,
+                   Section.term, Course.code, Course.name.label("course"))
+            .join(Section, Timeslot.section_id == Section.id)
+            .join(Course, Section.course_id == Course.id)
+            .join(Enrollment, Enrollment.section_id == Section.id)
+            .where(Enrollment.student_id == student_id, Section.term == term)
+            .order_by(Timeslot.weekday, Timeslot.start_time))
+
+
+def shape_timetable(term, rows):
+    table = {i: [] for i in range(1, 8)}
+    for r in rows:
+        table[r.weekday].append(dict(_slot(r), course=r.course, code=r.code, term=r.term))
+    return {"term": term, "table": table}
+
+
+def grades_stmt(student_id, term=""):
+    q = (select(Enrollment.id.label("enrollment_id"), Section.term, Course.code,
+                Course.name.label("course"), Assessment.title, Assessment.weight,
+                Assessment.full_score, Grade.score)
+         .select_from(Enrollment)
+         .join(Section, Enrollment.section_id == Section.id)
+         .join(Course, Section.course_id == Course.id)
+         .outerjoin(Assessment, Assessment.section_id == Section.id)
+         .outerjoin(Grade, and_(Grade.enrollment_id == Enrollment.id,
+                                Grade.assessment_id == Assessment.id))
+         .where(Enrollment.student_id == student_id))
+    if term:
+        q = q.where(Section.term == term)
+    return q.order_by(Section.term.desc(), Course.code, Enrollment.id, Assessment.id)
+
+
+def shape_grades(term, rows):
+    courses = {}
+    for r in rows:
+        c = courses.get(r.enrollment_id)
+        if c is None:
+            c = courses[r.enrollment_id] = {
+                "course": f"{r.course} ({r.code})", "term": r.term, "rows": [], "total": 0.0}
+        if r.title is None:
+            continue
+        c["rows"].append({"title": r.title, "weight": r.weight, "full": r.full_score, "score": r.score})
+        if r.score is not None:
+            c["total"] += (r.score / r.full_score) * r.weight
+    for c in courses.values():
+        c["total_percent"] = round(c.pop("total") * 100, 2)
+    return {"term": term, "courses": list(courses.values())}
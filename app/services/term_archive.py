@@ -0,0 +1,157 @@
+"""Term lifecycle: freeze a finished term into its own SQLite file.
+
+Archiving moves a term's rows out of the hot ``section``, ``timeslot``,
+``enrollment``, ``assessment``, ``grade`` and ``grade_event`` tables into
+``TERM_ARCHIVE_DIR/term-<term>.db``.  The archive keeps the same schema plus
+snapshot copies of the courses, teachers and students it references, so the
+regular models can read it through a read-only session: term-scoped queries
+go through ``session_for_term`` and are routed transparently (to the archive,
+or to the term's shard when sharding is configured).
+"""
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from flask import current_app, g
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..extensions import db
+from ..models import Course, Enrollment, Section, Student, Teacher, TermArchive
+from . import sharding
+from .term_rows import REFERENCE_MODELS, TERM_MODELS, copy_rows, move_rows
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def archive_path(term):
+    return Path(current_app.config["TERM_ARCHIVE_DIR"]) / f"term-{term}.db"
+
+
+def archive_term(term):
+    """Freeze ``term`` into its archive file and drop it from the hot tables."""
+    if db.session.execute(select(TermArchive).filter_by(term=term)).scalar_one_or_none():
+        raise ValueError(f"term {term} is already archived")
+    sess = sharding.session_for(term)
+    hot = sess.connection(bind_arguments={"mapper": Section})
+    if not hot.execute(select(func.count()).select_from(Section)
+                       .where(Section.term == term)).scalar():
+        raise ValueError(f"term {term} has no sections")
+
+    path = archive_path(term)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    eng = create_engine(f"sqlite:///{path.as_posix()}")
+    try:
+        db.metadata.create_all(eng, tables=[m.__table__ for m in
+                                            REFERENCE_MODELS + TERM_MODELS])
+        # OR REPLACE keeps a re-run after a failed hot-side commit idempotent;
+        # moving (not copying) holds the hot write lock until the commit below
+        with eng.begin() as arc:
+            counts = move_rows(hot, arc, term, TERM_MODELS, "OR REPLACE")
+            _copy_references(hot, arc)
+    finally:
+        eng.dispose()
+
+    if sess is not db.session:
+        sess.commit()
+    db.session.add(TermArchive(term=term, path=str(path), archived_at=datetime.utcnow(),
+                               sections=counts["section"], enrollments=counts["enrollment"]))
+    db.session.commit()
+    return counts
+
+
+def _copy_references(hot, arc):
+    """Snapshot the courses, teachers and students the archived rows refer to."""
+    for model, col in ((Course, Section.course_id), (Teacher, Section.teacher_id),
+                       (Student, Enrollment.student_id)):
+        t = model.__table__
+        ids = arc.execute(select(col).distinct()).scalars().all()
+        rows = [dict(r) for r in hot.execute(select(t).where(t.c.id.in_(ids))).mappings()]
+        if rows:
+            arc.execute(insert(t).prefix_with("OR REPLACE"), rows)
+
+
+def restore_term(term):
+    """Move an archived term back into the hot tables and delete its file."""
+    rec = db.session.execute(select(TermArchive).filter_by(term=term)).scalar_one_or_none()
+    if rec is None:
+        raise ValueError(f"term {term} is not archived")
+    _drop_reader(rec.path)
+    sess = sharding.session_for(term)
+    eng = create_engine(f"sqlite:///{Path(rec.path).as_posix()}")
+    try:
+        with eng.connect() as arc:
+            # courses/teachers/students deleted since archiving come back too
+            copy_rows(arc, db.session.connection(), term, REFERENCE_MODELS, "OR IGNORE")
+            counts = copy_rows(arc, sess.connection(bind_arguments={"mapper": Section}),
+                               term, TERM_MODELS)
+            sess.commit()
+    except IntegrityError:
+        sess.rollback()
+        db.session.rollback()
+        raise ValueError(f"term {term} collides with rows created after archiving")
+    finally:
+        eng.dispose()
+    db.session.delete(rec)
+    db.session.commit()
+    Path(rec.path).unlink(missing_ok=True)
+    return counts
+
+
+def _reader(path):
+    with _readers_lock:
+        eng = _readers.get(path)
+        if eng is None:
+            eng = create_engine(f"sqlite:///{Path(path).as_posix()}")
+
+            @event.listens_for(eng, "connect")
+            def _query_only(dbapi_conn, _):
+                dbapi_conn.execute("PRAGMA query_only = ON")
+
+            _readers[path] = eng
+        return eng
+
+
+def _drop_reader(path):
+    with _readers_lock:
+        eng = _readers.pop(path, None)
+    if eng is not None:
+        eng.dispose()
+
+
+def archived_terms():
+    return db.session.execute(select(TermArchive.term)
+                              .order_by(TermArchive.term.desc())).scalars().all()
+
+
+def hot_terms():
+    terms = sharding.scatter(lambda s: s.execute(select(Section.term).distinct()).scalars())
+    return sorted(set(terms), reverse=True)
+
+
+def session_for_term(term):
+    """The session that holds ``term``: its shard or a read-only archive."""
+    if not term:
+        return db.session
+    rec = db.session.execute(select(TermArchive).filter_by(term=term)).scalar_one_or_none()
+    if rec is None:
+        return sharding.session_for(term)
+    sessions = g.setdefault("term_sessions", {})
+    if term not in sessions:
+        sessions[term] = Session(bind=_reader(rec.path))
+    return sessions[term]
+
+
+def is_archive(sess):
+    return any(sess is s for s in g.get("term_sessions", {}).values())
+
+
+def close_term_sessions(exc=None):
+    for s in g.pop("term_sessions", {}).values():
+        s.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_term_sessions)
@@ -0,0 +1,77 @@
+"""Row-level copy/move of everything that belongs to one term.
+
+Shared by term archiving and shard moves.  All statements are scoped with
+subqueries on ``section.term`` so they work on any connection that holds
+the term, without shipping id lists around.
+"""
+from sqlalchemy import delete, insert, select
+
+from ..models import (Assessment, Course, Enrollment, Grade, GradeEvent, Section,
+                      Student, Teacher, Timeslot)
+
+# parent -> child order; deletes run in reverse
+TERM_MODELS = (Section, Timeslot, Enrollment, Assessment, Grade, GradeEvent)
+REFERENCE_MODELS = (Course, Teacher, Student)
+
+
+def term_selects(term):
+    """One SELECT per table name, scoped to ``term``."""
+    sec, ts, en, a, gr, ev = (m.__table__ for m in TERM_MODELS)
+    sids = select(sec.c.id).where(sec.c.term == term)
+    eids = select(en.c.id).where(en.c.section_id.in_(sids))
+    return {
+        "section": select(sec).where(sec.c.term == term),
+        "timeslot": select(ts).where(ts.c.section_id.in_(sids)),
+        "enrollment": select(en).where(en.c.section_id.in_(sids)),
+        "assessment": select(a).where(a.c.section_id.in_(sids)),
+        "grade": select(gr).where(gr.c.enrollment_id.in_(eids)),
+        "grade_event": select(ev).where(ev.c.section_id.in_(sids)),
+        "course": select(Course.__table__).where(Course.__table__.c.id.in_(
+            select(sec.c.course_id).where(sec.c.term == term))),
+        "teacher": select(Teacher.__table__).where(Teacher.__table__.c.id.in_(
+            select(sec.c.teacher_id).where(sec.c.term == term))),
+        "student": select(Student.__table__).where(Student.__table__.c.id.in_(
+            select(en.c.student_id).where(en.c.section_id.in_(sids)))),
+    }
+
+
+def copy_rows(src, dst, term, models, prefix=None):
+    """Copy ``term``'s rows of ``models`` from ``src`` to ``dst``; returns counts."""
+    selects = term_selects(term)
+    counts = {}
+    for m in models:
+        t = m.__table__
+        rows = [dict(r) for r in src.execute(selects[t.name]).mappings()]
+        if rows:
+            stmt = insert(t)
+            if prefix:
+                stmt = stmt.prefix_with(prefix)
+            dst.execute(stmt, rows)
+        counts[t.name] = len(rows)
+    return counts
+
+
+def move_rows(src, dst, term, models, prefix=None):
+    """Move ``term``'s rows of ``models`` from ``src`` to ``dst``; returns counts.
+
+    The rows are deleted first (children first) and the deleted rows are
+    what gets inserted, so nothing written to the term after a plain copy
+    could be dropped unseen: from the first DELETE on, ``src`` holds its
+    write lock until the caller commits.
+    """
+    selects = term_selects(term)
+    moved = {}
+    for m in reversed(models):
+        t = m.__table__
+        stmt = (delete(t).where(t.c.id.in_(select(selects[t.name].subquery().c.id)))
+                .returning(*t.c))
+        moved[t.name] = [dict(r) for r in src.execute(stmt).mappings()]
+    for m in models:
+        rows = moved[m.__table__.name]
+        if rows:
+            stmt = insert(m.__table__)
+            if prefix:
+                stmt = stmt.prefix_with(prefix)
+            dst.execute(stmt, rows)
+    return {m.__table__.name: len(moved[m.__table__.name]) for m in models}
+
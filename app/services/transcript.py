@@ -0,0 +1,250 @@
+"""Transcripts and credit-weighted GPA.
+
+A course result is the enrollment's weighted total (the same number "My
+grades" shows), mapped to a letter and grade points through the configured
+scale (``GPA_SCALES[GPA_SCALE]``).  Term GPA counts every attempt taken that
+term; cumulative GPA applies ``GPA_RETAKE_POLICY`` to repeated courses:
+``latest`` (last attempt counts), ``best`` (highest points) or ``all``.
+
+A course is finished once graded assessments carry the full weight of 1, or
+when its term is archived (missing work then counts as 0).  Until then it is
+listed in progress, its percent taken over the graded weight only, and it
+stays out of term and cumulative GPA (and so out of honors and probation).
+
+Course totals come from the stored ``enrollment.total`` (maintained by the
+gradebook and ``services.assessment_plan``), read with one statement per
+shard and archived term; the streams are merged by student, so a whole
+cohort is one pass over the data rather than one ``my_grades`` rebuild per
+student.
+Terms are ordered lexically (``2024F`` < ``2025S``).
+"""
+import bisect
+import heapq
+import threading
+import time
+from itertools import groupby
+
+from flask import current_app
+from sqlalchemy import func, literal, select
+
+from ..models import Assessment, Course, Enrollment, Grade, Section, Student
+from . import sharding, term_archive
+
+RETAKE_POLICIES = ("latest", "best", "all")
+EPS = 1e-6
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class Scale:
+    __slots__ = ("floors", "grades")
+
+    def __init__(self, bands):
+        bands = sorted(bands)
+        self.floors = [b[0] for b in bands]
+        self.grades = [(b[1], b[2]) for b in bands]
+
+    def __call__(self, percent):
+        i = bisect.bisect_right(self.floors, percent + 1e-9) - 1
+        return self.grades[max(i, 0)]
+
+
+def current_scale():
+    cfg = current_app.config
+    return Scale(cfg["GPA_SCALES"][cfg["GPA_SCALE"]])
+
+
+def course_rows_stmt(student_ids=None, closed=False):
+    """One row per graded enrollment with its stored weighted percent.
+
+    ``graded_weight`` is the weight of the assessments graded so far;
+    ``closed`` marks rows read from an archived term.
+    """
+    graded = (select(func.coalesce(func.sum(Assessment.weight), 0.0))
+              .select_from(Grade)
+              .join(Assessment, Grade.assessment_id == Assessment.id)
+              .where(Grade.enrollment_id == Enrollment.id)
+              .scalar_subquery())
+    q = (select(Enrollment.student_id, Student.student_no, Student.name.label("student"),
+                Enrollment.id.label("enrollment_id"), Section.term,
+                Course.id.label("course_id"), Course.code, Course.name.label("course"),
+                Course.credits, Enrollment.total.label("percent"),
+                graded.label("graded_weight"), literal(closed).label("closed"))
+         .select_from(Enrollment)
+         .join(Student, Enrollment.student_id == Student.id)
+         .join(Section, Enrollment.section_id == Section.id)
+         .join(Course, Section.course_id == Course.id)
+         .where(Enrollment.total.is_not(None))
+         .order_by(Enrollment.student_id))
+    if student_ids is not None:
+        q = q.where(Enrollment.student_id.in_(student_ids))
+    return q
+
+
+def _sources():
+    """``[(session, closed)]`` for every shard and archived term."""
+    archives = [(term_archive.session_for_term(t), True) for t in term_archive.archived_terms()]
+    return [(s, False) for s in sharding.all_sessions()] + archives
+
+
+def _gpa(courses):
+    credits = sum(c["credits"] for c in courses)
+    if not credits:
+        return credits, None
+    return credits, round(sum(c["points"] * c["credits"] for c in courses) / credits, 2)
+
+
+def build(rows, scale, retake):
+    """Transcript dict for one student's course rows."""
+    rows = sorted(rows, key=lambda r: (r.term, r.enrollment_id))
+    terms, attempts = {}, {}
+    for r in rows:
+        done = bool(r.closed) or r.graded_weight >= 1 - EPS
+        percent = r.percent if done or not r.graded_weight else r.percent / r.graded_weight
+        letter, points = scale(percent)
+        c = {"code": r.code, "course": r.course, "credits": r.credits,
+             "percent": round(percent, 2), "letter": letter, "points": points,
+             "counted": done, "in_progress": not done}
+        terms.setdefault(r.term, []).append(c)
+        if done:
+            attempts.setdefault(r.course_id, []).append(c)
+    if retake != "all":
+        for tries in attempts.values():
+            if len(tries) > 1:
+                if retake == "latest":
+                    keep = tries[-1]
+                else:
+                    keep = max(reversed(tries), key=lambda c: c["points"])
+                for c in tries:
+                    c["counted"] = c is keep
+    out = []
+    for term, courses in terms.items():
+        credits, gpa = _gpa([c for c in courses if not c["in_progress"]])
+        out.append({"term": term, "courses": courses, "credits": credits, "gpa": gpa})
+    credits, gpa = _gpa([c for cs in terms.values() for c in cs if c["counted"]])
+    first = rows[0] if rows else None
+    return {"student_id": first.student_id if first else None,
+            "student_no": first.student_no if first else None,
+            "student": first.student if first else None,
+            "terms": out, "credits": credits, "gpa": gpa}
+
+
+def transcripts(student_ids=None):
+    """Yield one transcript per student with graded courses, by student id."""
+    scale, retake = current_scale(), current_app.config["GPA_RETAKE_POLICY"]
+    streams = [s.execute(course_rows_stmt(student_ids, closed)) for s, closed in _sources()]
+    merged = heapq.merge(*streams, key=lambda r: r.student_id)
+    for _, rows in groupby(merged, key=lambda r: r.student_id):
+        yield build(list(rows), scale, retake)
+
+
+def transcript(student):
+    """Transcript of one ``Student`` (empty if nothing is graded yet)."""
+    for t in transcripts([student.id]):
+        return t
+    return {"student_id": student.id, "student_no": student.student_no,
+            "student": student.name, "terms": [], "credits": 0, "gpa": None}
+
+
+def cached_transcript(student):
+    ttl = current_app.config["TRANSCRIPT_CACHE_SECONDS"]
+    now = time.monotonic()
+    with _cache_lock:
+        hit = _cache.get(student.id)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+    t = transcript(student)
+    with _cache_lock:
+        _cache[student.id] = (now + ttl, t)
+    return t
+
+
+def invalidate(student_ids=None):
+    """Drop cached transcripts (all of them when ``student_ids`` is None)."""
+    with _cache_lock:
+        if student_ids is None:
+            _cache.clear()
+        else:
+            for sid in student_ids:
+                _cache.pop(sid, None)
+
+
+def honors(term, min_gpa=None, min_credits=None):
+    """``[(transcript, term entry)]`` meeting the honors bar for ``term``."""
+    cfg = current_app.config
+    min_gpa = cfg["HONORS_MIN_GPA"] if min_gpa is None else min_gpa
+    min_credits = cfg["HONORS_MIN_CREDITS"] if min_credits is None else min_credits
+    out = []
+    for t in transcripts():
+        for e in t["terms"]:
+            if e["term"] == term and e["gpa"] is not None \
+                    and e["gpa"] >= min_gpa and e["credits"] >= min_credits:
+                out.append((t, e))
+    return out
+
+
+def probation(max_gpa=None):
+    """Transcripts whose cumulative GPA is below ``max_gpa``."""
+    if max_gpa is None:
+        max_gpa = current_app.config["PROBATION_MAX_GPA"]
+    return [t for t in transcripts() if t["gpa"] is not None and t["gpa"] < max_gpa]
+
+
+# ---------- bulk output ----------
+CSV_HEADER = ("student_no", "student", "term", "code", "course", "credits",
+              "percent", "letter", "points", "counted", "in_progress", "term_gpa",
+              "cumulative_gpa")
+
+
+def csv_rows(t):
+    for e in t["terms"]:
+        for c in e["courses"]:
+            yield (t["student_no"], t["student"], e["term"], c["code"], c["course"],
+                   c["credits"], c["percent"], c["letter"], c["points"],
+                   int(c["counted"]), int(c["in_progress"]), e["gpa"], t["gpa"])
+
+
+def text_lines(t):
+    lines = [f"Transcript: {t['student']} ({t['student_no']})", ""]
+    for e in t["terms"]:
+        lines.append(f"Term {e['term']}    credits {e['credits']}    GPA {e['gpa']}")
+        for c in e["courses"]:
+            mark = "  (in progress)" if c["in_progress"] else "" if c["counted"] else "  (retaken)"
+            lines.append(f"  {c['code']:<10} {c['course'][:36]:<36} {c['credits']:>3} "
+                         f"{c['percent']:>7.2f}  {c['letter']:<3} {c['points']:.1f}{mark}")
+        lines.append("")
+    lines.append(f"Cumulative credits {t['credits']}    GPA {t['gpa']}")
+    return lines
+
+
+def _pdf_text(s):
+    s = s.encode("latin-1", "replace").decode("latin-1")
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf(lines, per_page=54):
+    """Minimal PDF (Courier, A4) of plain text lines; no external dependency."""
+    pages = [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for page in pages:
+        body = "BT /F1 9 Tf 11 TL 40 800 Td\n" + "".join(
+            f"({_pdf_text(line)}) '\n" for line in page) + "ET"
+        stream = body.encode("latin-1")
+        objs.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                    b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objs))
+        kids.append(len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
@@ -4,4 +4,40 @@ BASE_DIR = Path(__file__).resolve().parent
 class Config:
     SECRET_KEY = "dev-secret"
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{(BASE_DIR / 'student.db').as_posix()}"
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    GRADE_ARCHIVE_DIR = BASE_DIR / "archive"
+    GRADE_EVENT_RETENTION_DAYS = 180
+    TERM_ARCHIVE_DIR = BASE_DIR / "archive" / "terms"
+    ASYNC_POOL_SIZE = 10          # aiosqlite connections per ASGI worker
+    ASYNC_POOL_TIMEOUT = 5        # seconds to wait for one before answering 503
+    SEAT_FEED_INTERVAL_MS = 250   # at most one seat update per section per window
+    SEAT_FEED_QUEUE_SIZE = 32     # per subscriber; overflow forces a resync
+    SEAT_FEED_RESYNC_SECONDS = 5  # per-term poll that picks up other workers' writes
+    SHARDS = {}                   # name -> sqlite URI; empty = everything in the main DB
+    SHARD_ID_BLOCK = 100          # ids reserved per allocator round trip
+    # (minimum percent, letter, grade points)
+    GPA_SCALES = {
+        "4.0": [(90, "A", 4.0), (85, "A-", 3.7), (82, "B+", 3.3), (78, "B", 3.0),
+                (75, "B-", 2.7), (72, "C+", 2.3), (68, "C", 2.0), (64, "C-", 1.5),
+                (60, "D", 1.0), (0, "F", 0.0)],
+        "5.0": [(90, "A", 5.0), (80, "B", 4.0), (70, "C", 3.0), (60, "D", 2.0), (0, "F", 0.0)],
+    }
+    GPA_SCALE = "4.0"
+    GPA_RETAKE_POLICY = "latest"  # latest | best | all
+    HONORS_MIN_GPA = 3.7
+    HONORS_MIN_CREDITS = 12
+    PROBATION_MAX_GPA = 2.0       # cumulative GPA below this
+    TRANSCRIPT_CACHE_SECONDS = 300
+    PLANNER_SNAPSHOT_SECONDS = 60     # per-term section/timeslot snapshot lifetime
+    PLANNER_MAX_COMBINATIONS = 20000  # conflict-free combinations scored per request
+    PLANNER_MAX_STEPS = 200000        # section/mask tests per request, dead ends included
+    PLANNER_MAX_COURSES = 8           # courses in one planning request
+    GRADEBOOK_PAGE_SIZE = 50          # students per gradebook block
+    BULK_ENROLL_CHUNK = 500           # enrollments inserted (and committed) per statement
+    PROFILE_DIR = BASE_DIR / "profiles"
+    PROFILE_MAX_FILES = 200           # ring buffer: oldest profiles are deleted first
+    PROFILE_SAMPLE_RATE = 0.0         # fraction of requests profiled at random
+    PROFILE_INTERVAL_MS = 5           # stack sampling period
+    PROFILE_MAX_STATEMENTS = 1000     # SQL statements kept per profile
+    PROFILE_HEADER = "X-Profile"      # carries a token from `flask profiles token`
+    PROFILE_TOKEN_MAX_AGE = 86400     # seconds a header token stays valid
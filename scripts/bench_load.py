@@ -0,0 +1,146 @@
+"""Concurrent-user load benchmark for the student read endpoints.
+
+Run it once against each deployment and compare the capacity line:
+
+    gunicorn -w 4 -b 127.0.0.1:8000 wsgi:app
+    uvicorn asgi:app --workers 4 --port 8001
+
+    python scripts/bench_load.py --url http://127.0.0.1:8000 --user S001 --password 123456
+    python scripts/bench_load.py --url http://127.0.0.1:8001 --user S001 --password 123456
+
+Each virtual user logs in once, then loops over ``--path`` with keep-alive
+connections (stdlib only).  Capacity is the largest concurrency level whose
+p95 latency stays under ``--slo-ms`` with < 1% errors.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_PATHS = [
+    "/student/api/sections?term={term}",
+    "/student/api/seats?term={term}",
+    "/student/api/timetable",
+    "/student/api/grades",
+]
+
+
+class Conn:
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, cookie=None, body=b"", ctype=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                f"Content-Length: {len(body)}"]
+        if cookie:
+            head.append(f"Cookie: {cookie}")
+        if ctype:
+            head.append(f"Content-Type: {ctype}")
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            k, _, v = line.partition(":")
+            headers.setdefault(k.strip().lower(), []).append(v.strip())
+        if "content-length" in headers:
+            data = await self.reader.readexactly(int(headers["content-length"][0]))
+        elif headers.get("transfer-encoding", [""])[0].lower() == "chunked":
+            data = b""
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                data += await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            data = await self.reader.read()
+            self.close()
+        if headers.get("connection", [""])[0].lower() == "close":
+            self.close()
+        return status, headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def login(host, port, user, password):
+    c = Conn(host, port)
+    body = urlencode({"username": user, "password": password}).encode()
+    status, headers, _ = await c.request("POST", "/auth/login", body=body,
+                                         ctype="application/x-www-form-urlencoded")
+    c.close()
+    for v in headers.get("set-cookie", []):
+        if v.startswith("session="):
+            return v.split(";", 1)[0]
+    raise SystemExit(f"login failed for {user} (HTTP {status})")
+
+
+async def user_loop(host, port, cookie, paths, deadline, lat, errors):
+    c = Conn(host, port)
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]; i += 1
+        t0 = time.perf_counter()
+        try:
+            status, _, _ = await c.request("GET", path, cookie=cookie)
+            if status != 200:
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            errors.append(type(e).__name__)
+            c.close()
+        lat.append(time.perf_counter() - t0)
+    c.close()
+
+
+async def run_level(host, port, cookie, paths, users, duration):
+    lat, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(user_loop(host, port, cookie, paths, deadline, lat, errors)
+                           for _ in range(users)))
+    lat.sort()
+    n = len(lat)
+    return {
+        "users": users, "requests": n, "rps": n / duration, "errors": len(errors),
+        "p50": lat[n // 2] * 1000 if n else 0,
+        "p95": lat[int(n * 0.95)] * 1000 if n else 0,
+        "mean": statistics.fmean(lat) * 1000 if n else 0,
+    }
+
+
+async def main(args):
+    u = urlsplit(args.url)
+    host, port = u.hostname, u.port or 80
+    cookie = await login(host, port, args.user, args.password)
+    paths = [p.format(term=args.term) for p in (args.path or DEFAULT_PATHS)]
+    print(f"{args.url}  paths={len(paths)}  duration={args.duration}s per level")
+    print(f"{'users':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    capacity = 0
+    for users in (int(x) for x in args.concurrency.split(",")):
+        r = await run_level(host, port, cookie, paths, users, args.duration)
+        print(f"{r['users']:>6} {r['rps']:>9.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['errors']:>7}")
+        if r["p95"] <= args.slo_ms and r["errors"] <= 0.01 * max(r["requests"], 1):
+            capacity = users
+    print(f"capacity: {capacity} concurrent users (p95 <= {args.slo_ms} ms, < 1% errors)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--user", required=True)
+    ap.add_argument("--password", default="123456")
+    ap.add_argument("--term", default="2025S")
+    ap.add_argument("--path", action="append", help="repeatable; defaults to the four student API paths")
+    ap.add_argument("--concurrency", default="10,50,100,200,500")
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--slo-ms", type=float, default=500.0)
+    asyncio.run(main(ap.parse_args()))